@@ -3,42 +3,271 @@ Debug version of Trac Change History Scraper
 Prints out the HTML structure to help diagnose parsing issues
 """
 
+import argparse
 import asyncio
+import re
+from collections.abc import Iterable
 from pathlib import Path
-from bs4 import BeautifulSoup
+import httpx
+from lxml import etree
+from lxml import html as lh
 from playwright.async_api import async_playwright
 
+from trac_helpers import (
+    block_subresources,
+    has_class,
+    node_text,
+    strong_and_ems,
+    text_preview,
+    xpath_first,
+)
 
-async def debug_trac_html(base_url: str, ticket_id: int, output_file: str = "debug_html.txt"):
+
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}")
+
+
+# Compiled once at import time; libxml2 evaluates these without a Python tree walk
+XP_CHANGELOG = etree.XPath("//*[@id='changelog']")
+XP_HISTORY = etree.XPath("//*[@id='history']")
+XP_CHANGES_ID = etree.XPath("//*[@id='changes']")
+XP_CHANGELOG_CLASS = etree.XPath(f"//*[{has_class('changelog')}]")
+XP_HISTORY_CLASS = etree.XPath(f"//*[{has_class('history')}]")
+XP_CHANGE_DIVS = etree.XPath(f".//div[{has_class('change')}]")
+XP_CHANGE_LIS = etree.XPath(f".//li[{has_class('change')}]")
+
+# Where only a count or the first few hits are reported, count() and
+# position() limits keep libxml2 from handing back every match
+_CHANGE_ANY = ".//*[(self::div or self::li) and contains(@class, 'change')]"
+_H3_CHANGES = ".//h3[not(*)][contains(., 'Changed') or contains(., 'comment')]"
+_UL_CHANGES = f"//ul[{has_class('changes')}]"
+XP_CHANGE_ANY_COUNT = etree.XPath(f"count({_CHANGE_ANY})")
+XP_H3_CHANGES_COUNT = etree.XPath(f"count({_H3_CHANGES})")
+XP_FIRST_H3_CHANGES = etree.XPath(f"({_H3_CHANGES})[position() <= 3]")
+XP_UL_CHANGES_COUNT = etree.XPath(f"count({_UL_CHANGES})")
+XP_FIRST_UL_CHANGES_DOC = etree.XPath(f"({_UL_CHANGES})[1]")
+XP_DIV_COMMENT_COUNT = etree.XPath(f"count(//div[{has_class('comment')}])")
+XP_H3_COUNT = etree.XPath("count(//h3)")
+XP_FIRST_H3S = etree.XPath("(//h3)[position() <= 10]")
+XP_FIRST_H3 = etree.XPath(".//h3[1]")
+XP_FIRST_UL_CHANGES = etree.XPath(f".//ul[{has_class('changes')}][1]")
+XP_CHILD_LIS = etree.XPath("./li")
+XP_FIRST_DIV_COMMENT = etree.XPath(f".//div[{has_class('comment')}][1]")
+XP_PROPERTYFORM = etree.XPath("//form[@id='propertyform']")
+XP_TICKET = etree.XPath("//*[@id='ticket']")
+XP_FIELDSETS_COUNT = etree.XPath("count(//fieldset)")
+XP_FIRST_FIELDSETS = etree.XPath("(//fieldset)[position() <= 3]")
+XP_LEGEND = etree.XPath(".//legend[1]")
+XP_CHANGED_DIVS = etree.XPath("//div[not(*)][contains(., 'Changed')]")
+
+
+# Pages bigger than this are stream-parsed for #changelog before
+# falling back to a full tree
+STREAM_THRESHOLD = 500_000
+_STREAM_CHUNK = 64 * 1024
+
+
+def _stream_changelog(html: str):
+    """
+    Pull-parse ``html`` just far enough to complete ``<div id="changelog">``.
+
+    Only div events reach Python. Divs closed before the changelog opens are
+    cleared as they end, so the page above it is never held in full and
+    nothing after it is parsed. Returns None if there is no such div.
+    """
+    parser = etree.HTMLPullParser(events=("start", "end"), tag="div")
+    parser.set_element_class_lookup(lh.HtmlElementClassLookup())
+    depth = 0  # nesting level inside the changelog, 0 while outside it
+    for i in range(0, len(html), _STREAM_CHUNK):
+        parser.feed(html[i:i + _STREAM_CHUNK])
+        for event, el in parser.read_events():
+            if depth:
+                depth += 1 if event == "start" else -1
+                if not depth:
+                    return el
+            elif el.get("id") == "changelog":
+                depth = 1
+            elif event == "end":
+                el.clear()
+    return None
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+class BrowserPool:
+    """
+    Fetches ticket pages for a debugging run.
+
+    Trac renders tickets server-side, so pages are first requested with one
+    shared ``httpx.AsyncClient`` (HTTP/2, pooled connections). Only when
+    that response has no ``#changelog`` is Chromium used: it is launched
+    lazily, a single context is created on first use and ``concurrency``
+    pages are kept open in it, so N tickets cost at most one browser
+    launch plus N navigations.
+    """
+
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = concurrency
+        self._client: httpx.AsyncClient | None = None
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._pages: asyncio.Queue | None = None
+        self._lock = asyncio.Lock()
+
+    async def get_browser(self):
+        """Launch Chromium on first call and return the shared instance."""
+        async with self._lock:
+            if self._browser is None:
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+        return self._browser
+
+    async def get_context(self):
+        """Create the shared context and its page pool on first call."""
+        browser = await self.get_browser()
+        async with self._lock:
+            if self._context is None:
+                self._context = await browser.new_context(user_agent=USER_AGENT)
+                await self._context.route("**/*", block_subresources)
+                self._pages = asyncio.Queue()
+                for _ in range(self.concurrency):
+                    self._pages.put_nowait(await self._context.new_page())
+        return self._context
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first call."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                headers={"User-Agent": USER_AGENT},
+                follow_redirects=True,
+                timeout=30,
+            )
+        return self._client
+
+    async def fetch(self, url: str) -> tuple[int, str]:
+        """Fetch ``url``; returns (status, html or "")."""
+        try:
+            response = await self.get_client().get(url)
+        except httpx.HTTPError:
+            response = None
+        if response is not None and response.status_code == 200:
+            html = response.text
+            if 'id="changelog"' in html:
+                return 200, html
+        return await self.fetch_with_browser(url)
+
+    async def fetch_with_browser(self, url: str) -> tuple[int, str]:
+        """Load ``url`` on a pooled Chromium page; returns (status, html or "")."""
+        await self.get_context()
+        page = await self._pages.get()
+        try:
+            # Trac sends the whole ticket in the first response, so don't wait
+            # for DOMContentLoaded - return on commit and sniff for the markup
+            response = await page.goto(url, wait_until="commit", timeout=15000)
+            if response.status != 200:
+                return response.status, ""
+            for _ in range(5):
+                html = await page.content()
+                if 'id="changelog"' in html or 'id="propertyform"' in html:
+                    return response.status, html
+                await asyncio.sleep(0.2)
+            await page.wait_for_load_state("load")
+            return response.status, await page.content()
+        finally:
+            self._pages.put_nowait(page)
+
+    async def close(self):
+        """Shut everything down; each step runs even if an earlier one fails."""
+        client, browser, playwright = self._client, self._browser, self._playwright
+        self._client = self._playwright = self._browser = self._context = self._pages = None
+        try:
+            if client is not None:
+                await client.aclose()
+        finally:
+            try:
+                if browser is not None:
+                    await browser.close()
+            finally:
+                if playwright is not None:
+                    await playwright.stop()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def debug_trac_html(base_url: str, ticket_ids: list[int],
+                          output_file: str = "debug_html.txt", concurrency: int = 4,
+                          dump_html: bool = True):
     """
-    Fetch a ticket page and dump the relevant HTML for debugging.
+    Fetch ticket pages and dump the relevant HTML for debugging.
+
+    All tickets share one browser; with more than one ticket the HTML dumps
+    are written to ``<output stem>_<ticket id><suffix>``. Pass
+    ``dump_html=False`` to print the analysis without touching the disk.
+    Returns the paths of the HTML dumps actually written.
     """
+    output = Path(output_file)
+
+    async def _one(pool: BrowserPool, ticket_id: int):
+        if len(ticket_ids) > 1:
+            out = output.with_name(f"{output.stem}_{ticket_id}{output.suffix}")
+        else:
+            out = output
+        return await _debug_one(pool, base_url, ticket_id, str(out) if dump_html else None)
+
+    async with BrowserPool(concurrency) as pool:
+        # A failing ticket must not close the pool under the others still running
+        results = await asyncio.gather(
+            *(_one(pool, tid) for tid in ticket_ids), return_exceptions=True
+        )
+    written = []
+    for ticket_id, result in zip(ticket_ids, results):
+        if isinstance(result, Exception):
+            print(f"❌ Ticket #{ticket_id} failed: {result}")
+        elif result:
+            written.append(result)
+    return written
+
+
+async def debug_trac_ticket(base_url: str, ticket_id: int, output_file: str = "debug_html.txt",
+                            dump_html: bool = True):
+    """Single-ticket wrapper around :func:`debug_trac_html`."""
+    await debug_trac_html(base_url, [ticket_id], output_file, concurrency=1, dump_html=dump_html)
+
+
+async def _debug_one(pool: BrowserPool, base_url: str, ticket_id: int, output_file: str | None):
+    """Fetch one ticket through ``pool`` and print its analysis; returns the file written, if any."""
     url = f"{base_url}/ticket/{ticket_id}"
     
     print(f"🔍 Fetching: {url}\n")
     
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        )
-        page = await context.new_page()
-        
-        response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        
-        if response.status != 200:
-            print(f"❌ HTTP {response.status}")
-            await browser.close()
-            return
-        
-        html = await page.content()
-        await browser.close()
+    status, html = await pool.fetch(url)
+    if status != 200:
+        print(f"❌ HTTP {status}")
+        return None
     
-    soup = BeautifulSoup(html, "html.parser")
+    if output_file:
+        # Write full HTML to file on a worker thread so the loop keeps serving other fetches
+        await asyncio.to_thread(Path(output_file).write_text, html, encoding="utf-8")
+        print(f"✓ Full HTML saved to: {output_file}\n")
     
-    # Write full HTML to file
-    Path(output_file).write_text(html, encoding="utf-8")
-    print(f"✓ Full HTML saved to: {output_file}\n")
+    _analyze_html(html, output_file)
+    return output_file
+
+
+def _analyze_html(html: str, output_file: str | None):
+    """Print the structure report for ``html`` (``output_file`` is where it was saved, if anywhere)."""
+    # Large pages only need the changelog subtree unless it turns out empty
+    changelog = _stream_changelog(html) if len(html) > STREAM_THRESHOLD else None
+    doc = None
+    if changelog is None:
+        doc = lh.fromstring(html)
+        changelog = xpath_first(XP_CHANGELOG, doc)
     
     # Debug output
     print("="*70)
@@ -46,43 +275,47 @@ async def debug_trac_html(base_url: str, ticket_id: int, output_file: str = "deb
     print("="*70)
     
     # 1. Check for #changelog
-    changelog = soup.find(id="changelog")
     print(f"\n1. #changelog div exists? {changelog is not None}")
     
-    if changelog:
-        print(f"   - Tag: {changelog.name}")
+    if changelog is not None:
+        print(f"   - Tag: {changelog.tag}")
         print(f"   - Classes: {changelog.get('class')}")
     else:
         # Look for alternative IDs/classes used for change history
         print("\n   Checking for alternative change history containers...")
         alternatives = [
-            soup.find(id="history"),
-            soup.find(id="changes"),
-            soup.find(class_="changelog"),
-            soup.find(class_="history"),
+            xpath_first(XP_HISTORY, doc),
+            xpath_first(XP_CHANGES_ID, doc),
+            xpath_first(XP_CHANGELOG_CLASS, doc),
+            xpath_first(XP_HISTORY_CLASS, doc),
         ]
         for alt in alternatives:
-            if alt:
-                print(f"   - Found: <{alt.name}> id='{alt.get('id')}' class='{alt.get('class')}'")
+            if alt is not None:
+                print(f"   - Found: <{alt.tag}> id='{alt.get('id')}' class='{alt.get('class')}'")
     
     # 2. Look for change blocks with various patterns
     print(f"\n2. Looking for change blocks with different patterns...")
     
+    # Only the changelog subtree is searched when there is one; the
+    # whole-document probes below run only if it yields nothing
+    scope = changelog if changelog is not None else doc
+    if changelog is not None:
+        print("   (searching inside #changelog)")
+    
     # Try different selectors
-    change_divs = soup.find_all("div", class_="change")
+    change_divs = XP_CHANGE_DIVS(scope)
     print(f"   - <div class='change'>: {len(change_divs)} found")
     
-    change_lis = soup.find_all("li", class_="change")
+    change_lis = XP_CHANGE_LIS(scope)
     print(f"   - <li class='change'>: {len(change_lis)} found")
     
     # Check for divs with "change" in the class list
-    change_any = soup.find_all(lambda tag: tag.name in ["div", "li"] and 
-                                "change" in " ".join(tag.get("class", [])))
-    print(f"   - Elements with 'change' in class: {len(change_any)} found")
+    change_any = int(XP_CHANGE_ANY_COUNT(scope))
+    print(f"   - Elements with 'change' in class: {change_any} found")
     
     # Look for h3 tags with specific text patterns
-    h3_changes = soup.find_all("h3", string=lambda s: s and ("Changed" in s or "comment" in s))
-    print(f"   - <h3> tags with 'Changed' or 'comment': {len(h3_changes)} found")
+    h3_changes = int(XP_H3_CHANGES_COUNT(scope))
+    print(f"   - <h3> tags with 'Changed' or 'comment': {h3_changes} found")
     
     # Combined
     all_changes = change_divs + change_lis
@@ -91,33 +324,32 @@ async def debug_trac_html(base_url: str, ticket_id: int, output_file: str = "deb
         # Try to find the parent div of these h3 tags
         print("\n   ⚠️  No <div class='change'> found, but found <h3> tags with 'Changed'")
         print("   Checking parent structures...")
-        for h3 in h3_changes[:3]:
-            parent = h3.parent
-            print(f"     • <h3> parent: <{parent.name}> class='{parent.get('class')}' id='{parent.get('id')}'")
+        for h3 in XP_FIRST_H3_CHANGES(scope):
+            parent = h3.getparent()
+            print(f"     • <h3> parent: <{parent.tag}> class='{parent.get('class')}' id='{parent.get('id')}'")
             all_changes.append(parent)
     
     if not all_changes:
         print("\n   ⚠️  No change blocks found with standard patterns!")
         print("   Searching for ANY div/ul containing 'changes' class...")
+        if doc is None:
+            doc = lh.fromstring(html)
         
         # Very broad search
-        ul_changes = soup.find_all("ul", class_="changes")
-        print(f"   - <ul class='changes'>: {len(ul_changes)} found")
+        print(f"   - <ul class='changes'>: {int(XP_UL_CHANGES_COUNT(doc))} found")
+        print(f"   - <div class='comment'>: {int(XP_DIV_COMMENT_COUNT(doc))} found")
         
-        div_comment = soup.find_all("div", class_="comment")
-        print(f"   - <div class='comment'>: {len(div_comment)} found")
-        
-        if ul_changes:
+        first_ul = xpath_first(XP_FIRST_UL_CHANGES_DOC, doc)
+        if first_ul is not None:
             print("\n   Found <ul class='changes'> - showing parent structure:")
-            parent = ul_changes[0].parent
-            print(f"     Parent: <{parent.name}> class='{parent.get('class')}' id='{parent.get('id')}'")
+            parent = first_ul.getparent()
+            print(f"     Parent: <{parent.tag}> class='{parent.get('class')}' id='{parent.get('id')}'")
             all_changes.append(parent)
         
         # Check for h3 tags that might indicate changes
-        h3_tags = soup.find_all("h3")
-        print(f"\n   - Found {len(h3_tags)} <h3> tags total")
-        for h3 in h3_tags[:10]:  # Show first 10
-            text = h3.get_text(' ', strip=True)[:80]
+        print(f"\n   - Found {int(XP_H3_COUNT(doc))} <h3> tags total")
+        for h3 in XP_FIRST_H3S(doc):  # Show first 10
+            text = text_preview(h3, 80)
             if "changed" in text.lower() or "comment" in text.lower() or "by" in text.lower():
                 print(f"     • {h3.get('class')} — {text}")
     
@@ -126,40 +358,39 @@ async def debug_trac_html(base_url: str, ticket_id: int, output_file: str = "deb
         print(f"\n3. First change block analysis:")
         first = all_changes[0]
         
-        print(f"   - Tag: <{first.name}>")
+        print(f"   - Tag: <{first.tag}>")
         print(f"   - Classes: {first.get('class')}")
         print(f"   - ID: {first.get('id')}")
         
         # h3
-        h3 = first.find("h3")
-        if h3:
+        h3 = xpath_first(XP_FIRST_H3, first)
+        if h3 is not None:
             print(f"\n   - Has <h3>: Yes")
-            print(f"     Text: {h3.get_text(' ', strip=True)[:80]}")
+            print(f"     Text: {text_preview(h3, 80)}")
         else:
             print(f"\n   - Has <h3>: No")
         
         # ul.changes
-        ul = first.find("ul", class_="changes")
-        if ul:
+        ul = xpath_first(XP_FIRST_UL_CHANGES, first)
+        if ul is not None:
             print(f"\n   - Has <ul class='changes'>: Yes")
-            lis = ul.find_all("li", recursive=False)
+            lis = XP_CHILD_LIS(ul)
             print(f"     <li> items: {len(lis)}")
             if lis:
                 first_li = lis[0]
-                print(f"     First <li> text: {first_li.get_text(' ', strip=True)[:80]}")
-                strong = first_li.find("strong")
-                if strong:
-                    print(f"     Field name: {strong.get_text(strip=True)}")
-                ems = first_li.find_all("em")
+                print(f"     First <li> text: {text_preview(first_li, 80)}")
+                strong, ems = strong_and_ems(first_li)
+                if strong is not None:
+                    print(f"     Field name: {node_text(strong)}")
                 print(f"     <em> tags: {len(ems)}")
         else:
             print(f"\n   - Has <ul class='changes'>: No")
         
         # div.comment
-        comment_div = first.find("div", class_="comment")
-        if comment_div:
+        comment_div = xpath_first(XP_FIRST_DIV_COMMENT, first)
+        if comment_div is not None:
             print(f"\n   - Has <div class='comment'>: Yes")
-            comment_text = comment_div.get_text(strip=True)[:100]
+            comment_text = text_preview(comment_div, 100, sep="")
             print(f"     Text preview: {comment_text}...")
         else:
             print(f"\n   - Has <div class='comment'>: No")
@@ -167,11 +398,12 @@ async def debug_trac_html(base_url: str, ticket_id: int, output_file: str = "deb
         # Show raw HTML of first change
         print(f"\n4. Raw HTML of first change block (first 500 chars):")
         print("-" * 70)
-        print(str(first)[:500])
+        print(lh.tostring(first, encoding="unicode", with_tail=False)[:500])
         print("-" * 70)
     
-    print(f"\n5. Full HTML saved to: {output_file}")
-    print(f"   You can inspect the complete structure there.\n")
+    if output_file:
+        print(f"\n5. Full HTML saved to: {output_file}")
+        print(f"   You can inspect the complete structure there.\n")
     
     # 6. Extra checks for Trac 0.11 specific patterns
     print(f"\n6. Trac 0.11.x specific checks:")
@@ -180,50 +412,65 @@ async def debug_trac_html(base_url: str, ticket_id: int, output_file: str = "deb
     if "Changed" in html or "comment:" in html:
         print(f"   ✓ Found 'Changed' or 'comment:' in HTML")
     
-    # Check for common Trac 0.11 structures
-    form = soup.find("form", id="propertyform")
-    if form:
-        print(f"   ✓ Found #propertyform (ticket edit form)")
-    
-    # Look for the ticket box
-    ticket_box = soup.find(id="ticket")
-    if ticket_box:
-        print(f"   ✓ Found #ticket box")
-    
-    # Check for fieldset (Trac 0.11 often uses this)
-    fieldsets = soup.find_all("fieldset")
-    print(f"   - Found {len(fieldsets)} <fieldset> tags")
-    for fs in fieldsets[:3]:
-        legend = fs.find("legend")
-        if legend:
-            print(f"     • Legend: {legend.get_text(strip=True)}")
-    
-    # Look for any div that contains both "Changed" and a date pattern
-    import re
-    date_pattern = re.compile(r'\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}')
-    potential_changes = soup.find_all("div", string=lambda s: s and "Changed" in s and date_pattern.search(s or ""))
-    print(f"   - Divs with 'Changed' + date pattern: {len(potential_changes)}")
+    if all_changes:
+        print(f"   (whole-page checks skipped - change blocks were found)")
+    else:
+        # Check for common Trac 0.11 structures
+        form = xpath_first(XP_PROPERTYFORM, doc)
+        if form is not None:
+            print(f"   ✓ Found #propertyform (ticket edit form)")
+        
+        # Look for the ticket box
+        ticket_box = xpath_first(XP_TICKET, doc)
+        if ticket_box is not None:
+            print(f"   ✓ Found #ticket box")
+        
+        # Check for fieldset (Trac 0.11 often uses this)
+        print(f"   - Found {int(XP_FIELDSETS_COUNT(doc))} <fieldset> tags")
+        for fs in XP_FIRST_FIELDSETS(doc):
+            legend = xpath_first(XP_LEGEND, fs)
+            if legend is not None:
+                print(f"     • Legend: {node_text(legend)}")
+        
+        # Look for any div that contains both "Changed" and a date pattern;
+        # libxml2 narrows to the "Changed" divs, only those hit the regex
+        potential_changes = [
+            div for div in XP_CHANGED_DIVS(doc) if _DATE_RE.search(div.text_content())
+        ]
+        print(f"   - Divs with 'Changed' + date pattern: {len(potential_changes)}")
     
     print(f"\n{'='*70}")
-    print("Please share this output or the trac_debug.html file!")
+    print(f"Please share this output or the {output_file} file!" if output_file
+          else "Please share this output!")
     print(f"{'='*70}\n")
 
 
-async def main():
+async def main(ticket_ids: Iterable[int] = (1,), concurrency: int = 4):
     # Configure
     BASE_URL = "https://trac.ffmpeg.org"
-    TICKET_ID = 1  # Change this to your test ticket
     
-    await debug_trac_html(BASE_URL, TICKET_ID, "trac_debug.html")
+    written = await debug_trac_html(BASE_URL, list(ticket_ids), "trac_debug.html", concurrency)
     
     print("\n" + "="*70)
     print("NEXT STEPS:")
     print("="*70)
     print("1. Review the output above")
-    print("2. Check trac_debug.html for the full page source")
+    if written:
+        print(f"2. Check {', '.join(written)} for the full page source")
+    else:
+        print("2. No page source was saved (every fetch failed)")
     print("3. Look for the change history section in your browser")
     print("4. Share the findings so we can fix the parser\n")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Dump Trac ticket HTML for debugging")
+    parser.add_argument("ticket_ids", nargs="*", type=int, default=[1],
+                        help="ticket numbers to debug (default: 1)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="maximum number of tickets fetched at once")
+    args = parser.parse_args()
+
+    # One loop (and so one browser pool) for every ticket on the command line
+    with asyncio.Runner() as runner:
+        runner.run(main(args.ticket_ids, args.concurrency))
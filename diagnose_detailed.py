@@ -2,65 +2,140 @@
 Diagnostic version - shows exactly what's happening at each step
 """
 
+import argparse
 import asyncio
 import re
-from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
+from collections.abc import Iterable
+from itertools import islice
+from lxml import etree
+from lxml import html as lh
 
+from debug_trac_scraper import BrowserPool, XP_CHANGELOG, XP_CHILD_LIS
+from trac_helpers import (
+    first_matching,
+    has_class,
+    node_text,
+    strong_and_ems,
+    text_preview,
+    xpath_first,
+)
 
-async def diagnose_scraping(base_url: str, ticket_id: int):
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional - lxml parses the whole page instead
+    LexborHTMLParser = None
+
+_COMMENT_RE = re.compile(r"comment:(\d+)")
+_BY_RE = re.compile(r"\bby\s+(\S+)")
+_TS_TITLE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_AUTHOR_LABEL_RE = re.compile(r"changeLabel", re.I)
+
+
+# Compiled once at import time; libxml2 evaluates these without a Python tree walk
+XP_CHANGE = etree.XPath(f".//div[{has_class('change')}]")
+XP_H3_CHANGE = etree.XPath(f".//h3[{has_class('change')}]")
+XP_H3 = etree.XPath(".//h3")
+XP_TITLED_LINKS = etree.XPath(".//a[@title]")
+XP_LABELS = etree.XPath(".//label[@id]")
+XP_AUTHOR_SPAN = etree.XPath(".//span[contains(@class, 'trac-author')]")
+XP_UL_CHANGES = etree.XPath(f".//ul[{has_class('changes')}]")
+XP_DIV_COMMENT = etree.XPath(f".//div[{has_class('comment')}]")
+
+
+def _parse_changelog(html: str):
+    """
+    Return (changelog element or None, full document or None).
+
+    With selectolax installed the page is parsed by lexbor and only the
+    #changelog markup is handed to lxml, so the XPath queries run on a
+    small fragment. lxml parses the whole page when selectolax is missing
+    or finds no #changelog (e.g. a custom skin).
+    """
+    if LexborHTMLParser is not None:
+        node = LexborHTMLParser(html).css_first("#changelog")
+        if node is not None:
+            return lh.fragment_fromstring(node.html), None
+    doc = lh.fromstring(html)
+    return xpath_first(XP_CHANGELOG, doc), doc
+
+
+async def diagnose_many(base_url: str, ticket_ids: list[int], concurrency: int = 4):
+    """
+    Diagnose several tickets against one shared browser.
+    """
+    async with BrowserPool(concurrency) as pool:
+        # A failing ticket must not close the pool under the others still running
+        results = await asyncio.gather(
+            *(diagnose_scraping(base_url, tid, pool=pool) for tid in ticket_ids),
+            return_exceptions=True,
+        )
+    for ticket_id, result in zip(ticket_ids, results):
+        if isinstance(result, Exception):
+            print(f"❌ Ticket #{ticket_id} failed: {result}")
+
+
+async def diagnose_scraping(base_url: str, ticket_id: int, pool: BrowserPool | None = None):
     """
     Step-by-step diagnostic of what the scraper sees.
+
+    Pass ``pool`` to reuse an already running browser; otherwise a
+    single-page pool is opened for this ticket only.
     """
     url = f"{base_url}/ticket/{ticket_id}"
     
+    # Fetch the page before printing so concurrent reports don't interleave
+    if pool is None:
+        async with BrowserPool(concurrency=1) as own_pool:
+            status, html = await own_pool.fetch(url)
+    else:
+        status, html = await pool.fetch(url)
+    
     print(f"🔍 Diagnosing: {url}\n")
     print("="*70)
+    print("STEP 1: Fetching page...")
+    print(f"  Status: {status}")
     
-    # Fetch the page
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        )
-        page = await context.new_page()
-        
-        print("STEP 1: Fetching page...")
-        response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        print(f"  Status: {response.status}")
-        
-        if response.status != 200:
-            print("  ❌ Failed to fetch page")
-            await browser.close()
-            return
-        
-        html = await page.content()
-        await browser.close()
+    if status != 200:
+        print("  ❌ Failed to fetch page")
+        return
     
     print(f"  ✓ Page fetched ({len(html)} bytes)\n")
     
-    soup = BeautifulSoup(html, "html.parser")
+    # Cheap substring probes first - a page without a changelog isn't worth parsing
+    has_changelog = 'id="changelog"' in html
+    has_propertyform = 'id="propertyform"' in html
+    
+    if not has_changelog:
+        print("="*70)
+        print("STEP 2: Looking for #changelog...")
+        print("  ❌ No id=\"changelog\" anywhere in the page source")
+        if has_propertyform:
+            print("  ✓ #propertyform is present - this is a ticket page with no change history yet")
+        else:
+            print("  ⚠️  #propertyform is missing too - check for a login page, error page or custom skin")
+        return
     
     # Step 2: Find #changelog
     print("="*70)
     print("STEP 2: Looking for #changelog...")
-    changelog = soup.find(id="changelog")
+    changelog, doc = _parse_changelog(html)
+    found_changelog = changelog is not None
     
-    if changelog:
+    if found_changelog:
         print(f"  ✓ Found #changelog")
-        print(f"    Tag: <{changelog.name}>")
+        print(f"    Tag: <{changelog.tag}>")
         print(f"    Classes: {changelog.get('class')}")
-        print(f"    Children: {len(list(changelog.children))} elements")
+        print(f"    Children: {len(changelog)} elements")
     else:
         print("  ⚠️  #changelog not found")
         print("  Trying fallback (full document)...")
-        changelog = soup
+        changelog = doc
     
     # Step 3: Find change blocks
     print("\n" + "="*70)
     print("STEP 3: Looking for <div class='change'> blocks...")
     
-    change_divs = changelog.find_all("div", class_="change")
+    change_divs = XP_CHANGE(changelog)
     print(f"  Found: {len(change_divs)} blocks")
     
     if not change_divs:
@@ -68,12 +143,12 @@ async def diagnose_scraping(base_url: str, ticket_id: int):
         print("  Let me check what IS in the changelog...")
         
         # Show what's actually there
-        if changelog != soup:
+        if found_changelog:
             print(f"\n  Direct children of #changelog:")
-            for i, child in enumerate(list(changelog.children)[:10]):
-                if hasattr(child, 'name') and child.name:
-                    classes = child.get('class', [])
-                    print(f"    {i+1}. <{child.name}> class={classes}")
+            for i, child in enumerate(islice(changelog, 10)):
+                if isinstance(child.tag, str):
+                    classes = child.get('class', '').split()
+                    print(f"    {i+1}. <{child.tag}> class={classes}")
         
         return
     
@@ -82,45 +157,47 @@ async def diagnose_scraping(base_url: str, ticket_id: int):
     print(f"STEP 4: Analyzing first change block...")
     
     first_block = change_divs[0]
-    print(f"  Tag: <{first_block.name}>")
+    print(f"  Tag: <{first_block.tag}>")
     print(f"  Classes: {first_block.get('class')}")
     print(f"  ID: {first_block.get('id')}")
     
     # 4a: Find h3
     print(f"\n  4a. Looking for <h3>...")
-    h3 = first_block.find("h3", class_="change") or first_block.find("h3")
+    h3 = xpath_first(XP_H3_CHANGE, first_block)
+    if h3 is None:
+        h3 = xpath_first(XP_H3, first_block)
     
-    if h3:
+    if h3 is not None:
         print(f"    ✓ Found <h3>")
         print(f"      Classes: {h3.get('class')}")
         print(f"      ID: {h3.get('id')}")
-        print(f"      Text: {h3.get_text(' ', strip=True)[:100]}")
+        print(f"      Text: {text_preview(h3, 100)}")
         
         # Parse comment number
-        m = re.search(r"comment:(\d+)", h3.get_text())
+        m = _COMMENT_RE.search(h3.text_content())
         if m:
             print(f"      Comment #: {m.group(1)}")
         else:
             print(f"      Comment #: NOT FOUND")
         
         # Parse timestamp
-        time_tag = h3.find("a", title=re.compile(r"\d{4}-\d{2}-\d{2}"))
-        if time_tag:
-            print(f"      Timestamp: {time_tag['title']}")
+        time_tag = first_matching(XP_TITLED_LINKS(h3), "title", _TS_TITLE_RE)
+        if time_tag is not None:
+            print(f"      Timestamp: {time_tag.get('title')}")
         else:
             print(f"      Timestamp: NOT FOUND (no <a> with title containing date)")
         
         # Parse author
-        author_label = h3.find("label", id=re.compile(r"changeLabel", re.I))
-        author_span = h3.find("span", class_=re.compile(r"trac-author"))
+        author_label = first_matching(XP_LABELS(h3), "id", _AUTHOR_LABEL_RE)
+        author_span = xpath_first(XP_AUTHOR_SPAN, h3)
         
-        if author_label:
-            print(f"      Author (label): {author_label.get_text(strip=True)}")
-        elif author_span:
-            print(f"      Author (span): {author_span.get_text(strip=True)}")
+        if author_label is not None:
+            print(f"      Author (label): {node_text(author_label)}")
+        elif author_span is not None:
+            print(f"      Author (span): {node_text(author_span)}")
         else:
             # Try text pattern
-            m = re.search(r"\bby\s+(\S+)", h3.get_text())
+            m = _BY_RE.search(h3.text_content())
             if m:
                 print(f"      Author (text): {m.group(1)}")
             else:
@@ -130,39 +207,38 @@ async def diagnose_scraping(base_url: str, ticket_id: int):
     
     # 4b: Find <ul class="changes">
     print(f"\n  4b. Looking for <ul class='changes'>...")
-    ul = first_block.find("ul", class_="changes")
+    ul = xpath_first(XP_UL_CHANGES, first_block)
     
-    if ul:
+    if ul is not None:
         print(f"    ✓ Found <ul class='changes'>")
-        lis = ul.find_all("li", recursive=False)
+        lis = XP_CHILD_LIS(ul)
         print(f"      <li> count: {len(lis)}")
         
         if lis:
             first_li = lis[0]
             print(f"\n      First <li>:")
-            print(f"        Text: {first_li.get_text(' ', strip=True)[:100]}")
+            print(f"        Text: {text_preview(first_li, 100)}")
             
-            strong = first_li.find("strong")
-            if strong:
-                print(f"        Field: {strong.get_text(strip=True)}")
+            strong, ems = strong_and_ems(first_li)
+            if strong is not None:
+                print(f"        Field: {node_text(strong)}")
             else:
                 print(f"        Field: NO <strong> FOUND")
             
-            ems = first_li.find_all("em")
             print(f"        <em> count: {len(ems)}")
             if ems:
                 for i, em in enumerate(ems):
-                    print(f"          em[{i}]: {em.get_text(strip=True)}")
+                    print(f"          em[{i}]: {node_text(em)}")
     else:
         print(f"    ❌ No <ul class='changes'> found")
     
     # 4c: Find <div class="comment">
     print(f"\n  4c. Looking for <div class='comment'>...")
-    comment_div = first_block.find("div", class_=re.compile(r"\bcomment\b"))
+    comment_div = xpath_first(XP_DIV_COMMENT, first_block)
     
-    if comment_div:
+    if comment_div is not None:
         print(f"    ✓ Found <div class='comment'>")
-        comment_text = comment_div.get_text(strip=True)
+        comment_text = node_text(comment_div)
         print(f"      Length: {len(comment_text)} chars")
         print(f"      Preview: {comment_text[:100]}")
     else:
@@ -173,9 +249,9 @@ async def diagnose_scraping(base_url: str, ticket_id: int):
     print("STEP 5: Summary")
     print("="*70)
     
-    has_h3 = first_block.find("h3") is not None
-    has_ul = first_block.find("ul", class_="changes") is not None
-    has_comment = first_block.find("div", class_=re.compile(r"\bcomment\b")) is not None
+    has_h3 = h3 is not None
+    has_ul = ul is not None
+    has_comment = comment_div is not None
     
     print(f"  Has <h3>: {has_h3}")
     print(f"  Has <ul class='changes'>: {has_ul}")
@@ -192,18 +268,24 @@ async def diagnose_scraping(base_url: str, ticket_id: int):
     print("\n" + "="*70)
     print("STEP 6: Raw HTML of first change block")
     print("="*70)
-    print(str(first_block)[:1000])
+    print(lh.tostring(first_block, encoding="unicode", with_tail=False)[:1000])
     print("\n... (truncated)")
     print("="*70)
 
 
-async def main():
+async def main(ticket_ids: Iterable[int] = (1,)):
     # CONFIGURE HERE
     BASE_URL = "YOUR_TRAC_URL"  # e.g., "https://trac.example.com/projects/pcbtaskregister"
-    TICKET_ID = 1
     
-    await diagnose_scraping(BASE_URL, TICKET_ID)
+    await diagnose_many(BASE_URL, list(ticket_ids))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Step-by-step scraper diagnostics")
+    parser.add_argument("ticket_ids", nargs="*", type=int, default=[1],
+                        help="ticket numbers to diagnose (default: 1)")
+    args = parser.parse_args()
+
+    # One loop (and so one browser pool) for every ticket on the command line
+    with asyncio.Runner() as runner:
+        runner.run(main(args.ticket_ids))
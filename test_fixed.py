@@ -1,27 +1,37 @@
 """Quick test - should work now"""
+import argparse
 import asyncio
 from trac_change_history import TracChangeHistoryScraper
 
-async def test():
+
+async def test(concurrency=8):
     # EDIT THESE
     BASE_URL = "YOUR_TRAC_URL"
-    TICKET_ID = 1
+    TICKET_IDS = [1]
     
     scraper = TracChangeHistoryScraper(base_url=BASE_URL, output_dir="test_output")
-    events = await scraper.scrape(TICKET_ID)
+    results = await scraper.scrape_many(TICKET_IDS, concurrency)
     
-    if events:
-        print(f"\n✅ SUCCESS! Captured {len(events)} events")
-        e = events[0]
-        print(f"\nFirst event:")
-        print(f"  Comment #: {e['comment_num']}")
-        print(f"  Timestamp: {e['timestamp']}")
-        print(f"  Author: {e['author']}")
-        print(f"  Field changes: {len(e['field_changes'])}")
-        if e['field_changes']:
-            fc = e['field_changes'][0]
-            print(f"    Example: {fc['field']} {fc['action']} from '{fc['old_value']}' to '{fc['new_value']}'")
-    else:
-        print("\n❌ Still no events captured")
+    for ticket_id, events in zip(TICKET_IDS, results):
+        if isinstance(events, Exception):
+            print(f"\n❌ Scrape failed for #{ticket_id}: {events}")
+        elif events:
+            print(f"\n✅ SUCCESS! Captured {len(events)} events for #{ticket_id}")
+            e = events[0]
+            print(f"\nFirst event:")
+            print(f"  Comment #: {e['comment_num']}")
+            print(f"  Timestamp: {e['timestamp']}")
+            print(f"  Author: {e['author']}")
+            print(f"  Field changes: {len(e['field_changes'])}")
+            if e['field_changes']:
+                fc = e['field_changes'][0]
+                print(f"    Example: {fc['field']} {fc['action']} from '{fc['old_value']}' to '{fc['new_value']}'")
+        else:
+            print(f"\n❌ Still no events captured for #{ticket_id}")
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--concurrency", type=int, default=8,
+                    help="maximum number of tickets scraped at once")
+args = parser.parse_args()
 
-asyncio.run(test())
+asyncio.run(test(args.concurrency))
@@ -2,14 +2,15 @@
 Quick test of the updated Trac 0.11 scraper
 """
 
+import argparse
 import asyncio
 from trac_change_history import TracChangeHistoryScraper
 
 
-async def test():
+async def test(concurrency=8):
     # Configure for your Trac instance
     BASE_URL = "YOUR_TRAC_URL_HERE"  # e.g., "https://trac.example.com/projects/pcbtaskregister"
-    TICKET_ID = 1  # Change to your test ticket
+    TICKET_IDS = [1]  # Change to your test tickets
     
     scraper = TracChangeHistoryScraper(
         base_url=BASE_URL,
@@ -17,29 +18,37 @@ async def test():
     )
     
     print("Testing updated Trac 0.11.2.1 scraper...\n")
-    events = await scraper.scrape(TICKET_ID)
+    results = await scraper.scrape_many(TICKET_IDS, concurrency)
     
-    if events:
-        print(f"\n✅ SUCCESS! Captured {len(events)} events\n")
-        print("First event details:")
-        print(f"  Comment #: {events[0]['comment_num']}")
-        print(f"  Timestamp: {events[0]['timestamp']}")
-        print(f"  Author: {events[0]['author']}")
-        print(f"  Field changes: {len(events[0]['field_changes'])}")
-        if events[0]['field_changes']:
-            fc = events[0]['field_changes'][0]
-            print(f"    - {fc['field']}: {fc['old_value']} → {fc['new_value']}")
-        print(f"  Comment length: {len(events[0]['comment'])} chars")
-        
-        if events[0]['comment']:
-            print(f"  Comment preview: {events[0]['comment'][:100]}...")
-    else:
-        print("\n❌ No events captured")
-        print("Check that:")
-        print("  1. The URL is correct")
-        print("  2. The ticket has change history")
-        print("  3. You can access the ticket without auth errors")
+    for ticket_id, events in zip(TICKET_IDS, results):
+        if isinstance(events, Exception):
+            print(f"\n❌ Scrape failed for #{ticket_id}: {events}")
+        elif events:
+            print(f"\n✅ SUCCESS! Captured {len(events)} events for #{ticket_id}\n")
+            print("First event details:")
+            print(f"  Comment #: {events[0]['comment_num']}")
+            print(f"  Timestamp: {events[0]['timestamp']}")
+            print(f"  Author: {events[0]['author']}")
+            print(f"  Field changes: {len(events[0]['field_changes'])}")
+            if events[0]['field_changes']:
+                fc = events[0]['field_changes'][0]
+                print(f"    - {fc['field']}: {fc['old_value']} → {fc['new_value']}")
+            print(f"  Comment length: {len(events[0]['comment'])} chars")
+            
+            if events[0]['comment']:
+                print(f"  Comment preview: {events[0]['comment'][:100]}...")
+        else:
+            print(f"\n❌ No events captured for #{ticket_id}")
+            print("Check that:")
+            print("  1. The URL is correct")
+            print("  2. The ticket has change history")
+            print("  3. You can access the ticket without auth errors")
 
 
 if __name__ == "__main__":
-    asyncio.run(test())
+    parser = argparse.ArgumentParser(description="Quick test of the Trac 0.11 scraper")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="maximum number of tickets scraped at once")
+    args = parser.parse_args()
+
+    asyncio.run(test(args.concurrency))
@@ -33,16 +33,72 @@ HTML structure Trac renders:
   </div>
 """
 
+import argparse
 import asyncio
-import json
 import re
 from datetime import datetime
 from pathlib import Path
 
-from bs4 import BeautifulSoup, Tag
+from lxml import etree
 from playwright.async_api import async_playwright
 
 from symbols import sym
+from trac_helpers import (
+    block_subresources,
+    first_matching,
+    has_class,
+    json_bytes,
+    node_text,
+    strong_and_ems,
+    xpath_first,
+)
+
+
+_CNUM_RE = re.compile(r"comment:(\d+)")
+_CNUM_HREF_RE = re.compile(r"#comment:\d+")
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_TS_RE = re.compile(r"(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2})?(?:Z|[+-]\d{2}:\d{2})?)")
+_CHANGE_LABEL_RE = re.compile(r"changeLabel", re.I)
+_BY_RE = re.compile(r"\bby\s+(\S+)")
+
+# Serialised in the page so only the changelog crosses the CDP channel
+CHANGELOG_OUTER_HTML_JS = "() => document.getElementById('changelog')?.outerHTML ?? null"
+
+
+# Compiled once at import time; libxml2 does the tree walks
+XP_CHANGELOG = etree.XPath("//*[@id='changelog']")
+XP_DESCRIPTION = etree.XPath(f"//div[{has_class('description')}]")
+XP_CHANGE_BLOCKS = etree.XPath(f".//*[(self::div or self::li) and {has_class('change')}]")
+XP_CNUM = etree.XPath(f".//span[{has_class('cnum')}]")
+XP_HREF_LINKS = etree.XPath(".//a[@href]")
+XP_TITLED_LINKS = etree.XPath(".//a[@title]")
+XP_AUTHOR_SPAN = etree.XPath(".//span[contains(@class, 'trac-author')]")
+XP_ID_LABELS = etree.XPath(".//label[@id]")
+XP_CHILD_LIS = etree.XPath("./li")
+
+
+def _block_parts(block):
+    """
+    Return (header <h3>, <ul class="changes">, comment <div>) for a change
+    block, each None when absent.
+
+    One pass over the block's h3/ul/div descendants replaces a query per
+    part. The header is the first <h3 class="change">, else the first <h3>.
+    """
+    h3 = h3_change = ul = comment_div = None
+    for el in block.iterdescendants("h3", "ul", "div"):
+        classes = (el.get("class") or "").split()
+        if el.tag == "h3":
+            if h3 is None:
+                h3 = el
+            if h3_change is None and "change" in classes:
+                h3_change = el
+        elif el.tag == "ul":
+            if ul is None and "changes" in classes:
+                ul = el
+        elif comment_div is None and "comment" in classes:
+            comment_div = el
+    return (h3_change if h3_change is not None else h3), ul, comment_div
 
 
 class TracChangeHistoryScraper:
@@ -56,10 +112,15 @@ class TracChangeHistoryScraper:
         self.base_url = base_url.rstrip("/")
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        # Resolved once for log lines (absolute() calls os.getcwd())
+        self._abs_output_dir = self.output_dir.absolute()
+        self._playwright = None
+        self._browser = None
+        self._context = None
 
     # ── HTML parsing ──────────────────────────────────────────────────────────
 
-    def _parse_change_header(self, h3: Tag) -> dict:
+    def _parse_change_header(self, h3) -> dict:
         """
         Extract comment number, timestamp and author from an <h3 class="change">.
 
@@ -69,49 +130,49 @@ class TracChangeHistoryScraper:
         """
         result = {"comment_num": None, "timestamp": None, "author": None, "raw": ""}
 
-        result["raw"] = h3.get_text(" ", strip=True)
+        result["raw"] = node_text(h3, " ")
 
         # Comment number - check the id attribute first (Trac 0.11 style: id="comment:1")
         h3_id = h3.get("id", "")
         if h3_id:
-            m = re.search(r"comment:(\d+)", h3_id)
+            m = _CNUM_RE.search(h3_id)
             if m:
                 result["comment_num"] = int(m.group(1))
         
         # If not in id, check in text or href (newer Trac styles)
         if not result["comment_num"]:
-            cnum_tag = h3.find("span", class_="cnum") or h3.find("a", href=re.compile(r"#comment:\d+"))
-            if cnum_tag:
-                m = re.search(r"comment:(\d+)", cnum_tag.get_text() if hasattr(cnum_tag, 'get_text') else str(cnum_tag.get('href', '')))
+            cnum_tag = xpath_first(XP_CNUM, h3)
+            if cnum_tag is None:
+                cnum_tag = first_matching(XP_HREF_LINKS(h3), "href", _CNUM_HREF_RE)
+            if cnum_tag is not None:
+                m = _CNUM_RE.search(node_text(cnum_tag))
                 if m:
                     result["comment_num"] = int(m.group(1))
 
         # Timestamp — prefer the title attribute on an <a> tag (ISO 8601)
-        time_tag = h3.find("a", title=re.compile(r"\d{4}-\d{2}-\d{2}"))
-        if time_tag:
-            result["timestamp"] = time_tag["title"].strip()
+        time_tag = first_matching(XP_TITLED_LINKS(h3), "title", _DATE_RE)
+        if time_tag is not None:
+            result["timestamp"] = time_tag.get("title").strip()
         else:
             # Fall back: find anything that looks like a date/time in the text
-            m = re.search(
-                r"(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2})?(?:Z|[+-]\d{2}:\d{2})?)",
-                result["raw"],
-            )
+            m = _TS_RE.search(result["raw"])
             if m:
                 result["timestamp"] = m.group(1)
 
         # Author — <span class="trac-author">, <label>, or text after "by "
-        author_tag = (h3.find("span", class_=re.compile(r"trac-author")) or 
-                      h3.find("label", id=re.compile(r"changeLabel", re.I)))
-        if author_tag:
-            result["author"] = author_tag.get_text(strip=True)
+        author_tag = xpath_first(XP_AUTHOR_SPAN, h3)
+        if author_tag is None:
+            author_tag = first_matching(XP_ID_LABELS(h3), "id", _CHANGE_LABEL_RE)
+        if author_tag is not None:
+            result["author"] = node_text(author_tag)
         else:
-            m = re.search(r"\bby\s+(\S+)", result["raw"])
+            m = _BY_RE.search(result["raw"])
             if m:
                 result["author"] = m.group(1)
 
         return result
 
-    def _parse_field_changes(self, ul: Tag) -> list[dict]:
+    def _parse_field_changes(self, ul) -> list[dict]:
         """
         Parse <ul class="changes"> into a list of field-change dicts.
 
@@ -124,47 +185,48 @@ class TracChangeHistoryScraper:
               Those were added in Trac 1.0+ (r11112).
         """
         changes = []
-        for li in ul.find_all("li", recursive=False):
+        for li in XP_CHILD_LIS(ul):
             entry = {"field": None, "action": None, "old_value": None, "new_value": None}
 
-            strong = li.find("strong")
-            if strong:
-                entry["field"] = strong.get_text(strip=True)
+            strong, ems = strong_and_ems(li)
+            if strong is not None:
+                entry["field"] = node_text(strong)
 
-            ems = li.find_all("em")
-            li_text = li.get_text(" ", strip=True)
+            # Text is pulled once per element; the branches below only index it
+            em_texts = [node_text(em) for em in ems]
+            li_text = node_text(li, " ")
 
             # Parse the action based on text patterns
-            if "changed from" in li_text and len(ems) >= 2:
+            if "changed from" in li_text and len(em_texts) >= 2:
                 entry["action"] = "changed"
-                entry["old_value"] = ems[0].get_text(strip=True)
-                entry["new_value"] = ems[1].get_text(strip=True)
-            elif "set to" in li_text and ems:
+                entry["old_value"] = em_texts[0]
+                entry["new_value"] = em_texts[1]
+            elif "set to" in li_text and em_texts:
                 entry["action"] = "set"
-                entry["new_value"] = ems[0].get_text(strip=True)
+                entry["new_value"] = em_texts[0]
             elif "deleted" in li_text or "removed" in li_text:
                 entry["action"] = "deleted"
-                if ems:
-                    entry["old_value"] = ems[0].get_text(strip=True)
-            elif ems:
+                if em_texts:
+                    entry["old_value"] = em_texts[0]
+            elif em_texts:
                 # Generic fallback for unknown patterns
                 entry["action"] = "modified"
-                entry["new_value"] = ems[-1].get_text(strip=True)
-                if len(ems) > 1:
-                    entry["old_value"] = ems[0].get_text(strip=True)
+                entry["new_value"] = em_texts[-1]
+                if len(em_texts) > 1:
+                    entry["old_value"] = em_texts[0]
 
             if entry["field"]:
                 changes.append(entry)
 
         return changes
 
-    def _parse_comment_text(self, comment_div: Tag) -> str:
+    def _parse_comment_text(self, comment_div) -> str:
         """Extract plain text from <div class="comment searchable">."""
-        if not comment_div:
+        if comment_div is None:
             return ""
-        return comment_div.get_text("\n", strip=True)
+        return node_text(comment_div, "\n")
 
-    def _parse_changelog(self, soup: BeautifulSoup) -> list[dict]:
+    def _parse_changelog(self, doc) -> list[dict]:
         """
         Walk every change block in #changelog and return a list of events.
 
@@ -188,21 +250,18 @@ class TracChangeHistoryScraper:
 
         # Trac wraps the whole history in <div id="changelog"> …
         # Individual change blocks are <div class="change"> or <li class="change"> children.
-        changelog = soup.find(id="changelog")
+        changelog = xpath_first(XP_CHANGELOG, doc)
         
-        if not changelog:
+        if changelog is None:
             # Fallback: some older Trac versions might not use #changelog
-            changelog = soup.find("div", class_="description") or soup
+            changelog = xpath_first(XP_DESCRIPTION, doc)
+            if changelog is None:
+                changelog = doc
         
         # Find all change blocks
         # Support both old Trac (<div class="change">) and newer Bootstrap Trac
         # (<li class="… user-comment …"> or <li class="… ticket-state …">)
-        change_blocks = changelog.find_all(
-            lambda tag: (
-                tag.name in ("div", "li")
-                and "change" in tag.get("class", [])
-            )
-        )
+        change_blocks = XP_CHANGE_BLOCKS(changelog)
 
         for block in change_blocks:
             event = {
@@ -213,25 +272,25 @@ class TracChangeHistoryScraper:
                 "comment": "",
             }
 
+            # Look for <h3 class="change"> (standard) or just <h3> as fallback,
+            # <ul class="changes"> and the comment <div>, in a single pass
+            h3, ul, comment_div = _block_parts(block)
+
             # ── Header ────────────────────────────────────────────────────
-            # Look for <h3 class="change"> (standard) or just <h3> as fallback
-            h3 = block.find("h3", class_="change") or block.find("h3")
-            if h3:
+            if h3 is not None:
                 header = self._parse_change_header(h3)
                 event.update(
                     {k: header[k] for k in ("comment_num", "timestamp", "author")}
                 )
 
             # ── Field changes ─────────────────────────────────────────────
-            ul = block.find("ul", class_="changes")
-            if ul:
+            if ul is not None:
                 event["field_changes"] = self._parse_field_changes(ul)
 
             # ── Comment text ──────────────────────────────────────────────
             # Trac 0.11 uses <div class="comment">
             # Newer Trac might use <div class="comment searchable">
-            comment_div = block.find("div", class_=re.compile(r"\bcomment\b"))
-            if comment_div:
+            if comment_div is not None:
                 event["comment"] = self._parse_comment_text(comment_div)
 
             # Only add if there's actually something to record
@@ -300,14 +359,12 @@ class TracChangeHistoryScraper:
 
         return "\n".join(lines)
 
-    def _save(self, ticket_id: str, events: list[dict]):
-        """Save JSON output."""
+    async def _save(self, ticket_id: str, events: list[dict]):
+        """Save JSON output (serialised and written off the event loop)."""
         stem = f"ticket_{ticket_id}_history"
 
         json_path = self.output_dir / f"{stem}.json"
-        json_path.write_text(
-            json.dumps(events, indent=2, ensure_ascii=False), encoding="utf-8"
-        )
+        await asyncio.to_thread(lambda: json_path.write_bytes(json_bytes(events)))
         print(f"  {sym.tick} JSON saved: {json_path}")
 
     def _print_summary(self, ticket_id: str, events: list[dict]):
@@ -337,23 +394,22 @@ class TracChangeHistoryScraper:
             has_comment = sym.tick if ev["comment"] else sym.cross
             print(f"  {cnum:<6} {author:<18} {fields:<30} {has_comment}")
 
-    # ── Main entry point ──────────────────────────────────────────────────────
-
-    async def scrape(self, ticket_id: str | int):
-        """Fetch and parse the change history for a single ticket."""
-        ticket_id = str(ticket_id)
-        url = f"{self.base_url}/ticket/{ticket_id}"
-
-        print(f"\n{sym.rocket} Trac Change History Scraper")
-        print(f"{sym.link}  {url}")
-        print(f"{sym.folder} Output: {self.output_dir.absolute()}\n")
+    # ── Browser lifecycle ─────────────────────────────────────────────────────
 
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
+    async def open(self):
+        """
+        Launch the browser and context shared by every scrape() until close().
+        Also entered via ``async with scraper:``.
+        """
+        if self._context is not None:
+            return self
+        self._playwright = await async_playwright().start()
+        try:
+            self._browser = await self._playwright.chromium.launch(
                 headless=True,
                 args=["--disable-blink-features=AutomationControlled"],
             )
-            context = await browser.new_context(
+            self._context = await self._browser.new_context(
                 user_agent=(
                     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
                     "AppleWebKit/537.36 (KHTML, like Gecko) "
@@ -364,21 +420,62 @@ class TracChangeHistoryScraper:
                     "Accept-Language": "en-US,en;q=0.9",
                 },
             )
-            page = await context.new_page()
-            await page.add_init_script(
+            await self._context.add_init_script(
                 "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
             )
+            await self._context.route("**/*", block_subresources)
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def close(self):
+        """Close the shared browser; each step runs even if an earlier one fails."""
+        browser, playwright = self._browser, self._playwright
+        self._playwright = self._browser = self._context = None
+        try:
+            if browser is not None:
+                await browser.close()
+        finally:
+            if playwright is not None:
+                await playwright.stop()
+
+    async def __aenter__(self):
+        return await self.open()
 
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ── Main entry point ──────────────────────────────────────────────────────
+
+    async def scrape(self, ticket_id: str | int):
+        """
+        Fetch and parse the change history for a single ticket.
+
+        Runs on a fresh page of the shared context when the scraper is open;
+        otherwise a browser is brought up for this ticket alone.
+        """
+        if self._context is None:
+            async with TracChangeHistoryScraper(self.base_url, self.output_dir) as scraper:
+                return await scraper.scrape(ticket_id)
+
+        ticket_id = str(ticket_id)
+        url = f"{self.base_url}/ticket/{ticket_id}"
+
+        print(f"\n{sym.rocket} Trac Change History Scraper")
+        print(f"{sym.link}  {url}")
+        print(f"{sym.folder} Output: {self._abs_output_dir}\n")
+
+        page = await self._context.new_page()
+        try:
             print(f"{sym.hourglass} Loading ticket page...")
             response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
 
             if response.status == 403:
                 print(f"{sym.cross} Access denied (403). Try adding authentication.")
-                await browser.close()
                 return []
             if response.status != 200:
                 print(f"{sym.cross} HTTP {response.status} — cannot fetch ticket.")
-                await browser.close()
                 return []
 
             # Wait for the changelog to render
@@ -387,34 +484,66 @@ class TracChangeHistoryScraper:
             except Exception:
                 print(f"{sym.warning} #changelog not found — page may have no history yet.")
 
-            html = await page.content()
-            await browser.close()
+            # The whole page is only needed for the no-changelog fallback
+            html = await page.evaluate(CHANGELOG_OUTER_HTML_JS)
+            if html is None:
+                html = await page.content()
+        finally:
+            await page.close()
 
         print(f"{sym.tick} Page loaded. Parsing change history...")
-        soup = BeautifulSoup(html, "html.parser")
-        events = self._parse_changelog(soup)
+        # Plain etree elements: nothing here needs lxml.html's element classes
+        events = self._parse_changelog(etree.HTML(html))
 
         self._print_summary(ticket_id, events)
 
         print(f"\n{sym.file} Saving output...")
-        self._save(ticket_id, events)
+        await self._save(ticket_id, events)
 
         print(f"\n{sym.party} Done!")
         return events
 
+    async def scrape_many(self, ticket_ids, concurrency: int = 8) -> list[list[dict]]:
+        """
+        Scrape several tickets over one browser, at most ``concurrency`` pages
+        at a time. Results come back in ``ticket_ids`` order; a ticket that
+        failed comes back as its exception instead of a list of events.
+        """
+        if self._context is None:
+            async with TracChangeHistoryScraper(self.base_url, self.output_dir) as scraper:
+                return await scraper.scrape_many(ticket_ids, concurrency)
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _one(ticket_id):
+            async with sem:
+                return await self.scrape(ticket_id)
+
+        # A failing ticket must not close the browser under the others still running
+        results = await asyncio.gather(*map(_one, ticket_ids), return_exceptions=True)
+        for ticket_id, result in zip(ticket_ids, results):
+            if isinstance(result, Exception):
+                print(f"{sym.cross} Ticket #{ticket_id} failed: {result}")
+        return results
+
 
 # ── Entry point ───────────────────────────────────────────────────────────────
 
-async def main():
+async def main(concurrency: int = 8):
     # ── Configuration ─────────────────────────────────────────────────────────
     BASE_URL   = "https://trac.ffmpeg.org"
-    TICKET_ID  = 1234        # ← change to the ticket you want
+    TICKET_IDS = [1234]      # ← change to the tickets you want
     OUTPUT_DIR = "ffmpeg_ticket_history"
     # ─────────────────────────────────────────────────────────────────────────
 
-    scraper = TracChangeHistoryScraper(base_url=BASE_URL, output_dir=OUTPUT_DIR)
-    await scraper.scrape(TICKET_ID)
+    async with TracChangeHistoryScraper(base_url=BASE_URL, output_dir=OUTPUT_DIR) as scraper:
+        await scraper.scrape_many(TICKET_IDS, concurrency)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Trac ticket change history scraper")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="maximum number of tickets scraped at once")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.concurrency))
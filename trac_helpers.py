@@ -0,0 +1,82 @@
+"""
+Helpers shared by the Trac scraper and debugging scripts:
+XPath and text utilities for lxml trees, the Playwright route handler
+that keeps page loads to the HTML, and JSON encoding for saved output.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional - stdlib json is used instead
+    orjson = None
+
+# Subresources that play no part in the ticket markup
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "stylesheet", "font", "media"})
+
+
+def has_class(name: str) -> str:
+    """XPath predicate matching a single whitespace-separated class token."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def xpath_first(xpath, node):
+    """Return the first match of a compiled XPath, or None."""
+    hits = xpath(node)
+    return hits[0] if hits else None
+
+
+def first_matching(nodes, attr: str, pattern):
+    """Return the first node whose ``attr`` matches the compiled ``pattern``, or None."""
+    return next((n for n in nodes if pattern.search(n.get(attr))), None)
+
+
+def strong_and_ems(li):
+    """
+    Return (first <strong> or None, list of <em>) for a change <li>.
+
+    Both come from one pass over the descendants rather than a separate
+    query per tag.
+    """
+    strong = None
+    ems = []
+    for el in li.iterdescendants("strong", "em"):
+        if el.tag == "em":
+            ems.append(el)
+        elif strong is None:
+            strong = el
+    return strong, ems
+
+
+def node_text(node, sep: str = "") -> str:
+    """lxml equivalent of BeautifulSoup's ``get_text(sep, strip=True)``."""
+    return sep.join(s.strip() for s in node.itertext() if s.strip())
+
+
+def text_preview(node, n: int = 80, sep: str = " ") -> str:
+    """``node_text(node, sep)[:n]`` that stops walking once *n* chars are collected."""
+    out, total = [], 0
+    for s in node.itertext():
+        s = s.strip()
+        if not s:
+            continue
+        total += len(sep) + len(s) if out else len(s)
+        out.append(s)
+        if total >= n:
+            break
+    return sep.join(out)[:n]
+
+
+def block_subresources(route):
+    """Route handler: abort blocked resource types, let everything else through."""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return route.abort()
+    return route.continue_()
+
+
+def json_bytes(obj, indent: bool = True) -> bytes:
+    """UTF-8 JSON in one buffer, encoded by orjson when it is installed; single-line unless `indent`."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
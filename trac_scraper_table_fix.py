@@ -1,661 +1,1378 @@
+import argparse
 import asyncio
+import hashlib
 import json
+import logging
 import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+import httpx
+from lxml import etree
+from lxml import html as lh
 from playwright.async_api import async_playwright
 from datetime import datetime
 import re
 
+try:
+    import uvloop
+except ImportError:  # optional - the default asyncio event loop is used instead
+    uvloop = None
 
-async def scrape_trac_ticket(url: str, output_dir: str = "ticket_data", headless: bool = True):
+try:
+    import orjson
+except ImportError:  # optional - falls back to the stdlib json decoder
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # optional - only needed to save or read .json.zst tickets
+    zstandard = None
+
+from trac_helpers import block_subresources, has_class, json_bytes
+
+
+logger = logging.getLogger(__name__)
+
+
+_TICKET_RE = re.compile(r'/ticket/(\d+)')
+_TRAC_VERSION_RE = re.compile(r'Trac\s+([\d.]+)')
+
+# Attachment downloads in flight at once on the shared browser context
+ATTACHMENT_CONCURRENCY = 4
+
+# Attachments are streamed to disk this many bytes at a time
+DOWNLOAD_CHUNK = 64 * 1024
+
+# Saved ticket JSON the server can't revalidate is reused while younger than this (seconds)
+CACHE_MAX_AGE = 24 * 60 * 60
+
+# zstd level for compressed ticket saves; 3 is the usual speed/ratio knee
+ZSTD_LEVEL = 3
+
+# Tickets with more comments than this are hashed and encoded in a worker
+# thread; for smaller ones the thread hop costs more than the encode
+THREADED_ENCODE_COMMENTS = 200
+
+# Response headers kept with the ticket JSON to revalidate it on the next run
+VALIDATOR_HEADERS = ("etag", "last-modified")
+
+# Request header that sends each saved validator back for a conditional HEAD
+CONDITIONAL_HEADERS = {"etag": "If-None-Match", "last-modified": "If-Modified-Since"}
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+
+# Headers for the plain-HTTP fetches (ticket HTML, attachments, cache checks)
+HTTP_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+# One HTTP/2 client is shared per run; attachments and ticket pages on the same
+# Trac host multiplex over a single kept-alive connection
+HTTP_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+
+# A ticket fetched over plain HTTP with fewer fields than this is assumed to be
+# a login wall / bot check / JS-rendered page and is re-scraped in the browser
+MIN_HTTP_FIELDS = 3
+
+# Elements that mark a ticket / attachment page as parsed, used in place of fixed sleeps
+TICKET_READY_SELECTOR = "#ticket, #content"
+ATTACHMENT_READY_SELECTOR = "#content a[href*='raw-attachment'], #content .attachment"
+
+
+def _raw_attachment_url(attachment_page_url: str):
+    """Map a Trac /attachment/ticket/... page URL to its /raw-attachment/ twin."""
+    if '/attachment/ticket/' not in attachment_page_url:
+        return None
+    return attachment_page_url.replace('/attachment/ticket/', '/raw-attachment/ticket/', 1)
+
+
+# Pairs each <th> in a property row with the <td> after it and reads the
+# cell's value in the page. Form cells report their selected option / input
+# value / textarea text, matching what Trac shows when the ticket is opened
+# with edit controls.
+EXTRACT_ROW_JS = """
+row => {
+    const fields = {};
+    const cells = row.children;
+    for (let i = 0; i < cells.length; i++) {
+        const th = cells[i], td = cells[i + 1];
+        if (th.tagName !== 'TH' || !td || td.tagName !== 'TD') continue;
+        const header = th.textContent.trim().replace(/:+$/, '').toLowerCase();
+        let value;
+        const select = td.querySelector('select');
+        const input = td.querySelector("input[type='text']");
+        const textarea = td.querySelector('textarea');
+        if (select) {
+            const selected = select.querySelector('option[selected]');
+            value = selected
+                ? (selected.textContent.trim() || select.options[0]?.textContent)
+                : select.options[select.selectedIndex]?.text;
+        } else if (input) {
+            value = input.getAttribute('value');
+        } else if (textarea) {
+            value = textarea.textContent;
+        } else {
+            value = td.textContent;
+        }
+        value = (value || '').trim();
+        if (header && value) fields[header] = value;
+        i++;  // skip the td we just consumed
+    }
+    return fields;
+}
+"""
+
+# EXTRACT_ROW_JS mapped over every matched row, so the whole table costs one round-trip
+EXTRACT_ROWS_JS = f"rows => rows.map({EXTRACT_ROW_JS.strip()})"
+
+# Covers every layout: the property table may or may not carry class="properties"
+PROPERTY_ROWS_SELECTOR = "#properties tr"
+
+# Where some Trac versions put fields outside the property table; earlier
+# entries win when two selectors yield the same field
+ADDITIONAL_FIELD_SELECTORS = [
+    (".trac-field-reporter", "reporter"),
+    (".reporter", "reporter"),
+    (".trac-field-owner", "owner"),
+    (".owner", "owner"),
+    (".trac-field-status", "status"),
+    (".status", "status"),
+    (".trac-field-priority", "priority"),
+    (".trac-field-component", "component"),
+    (".trac-field-version", "version"),
+    (".trac-field-milestone", "milestone"),
+    (".trac-field-keywords", "keywords"),
+    (".trac-field-cc", "cc"),
+]
+
+# [[name, textContent or null], ...] for (selector, name) pairs, in order
+QUERY_TEXTS_JS = """
+pairs => pairs.map(([selector, name]) => [name, document.querySelector(selector)?.textContent ?? null])
+"""
+
+# Comment layouts across Trac versions, tried in order. For each container the
+# first author / timestamp / text selector with any text wins; NEXT_SIBLING
+# stands for the element right after the container (old Trac puts the comment
+# body in the div following its h3).
+NEXT_SIBLING = "+"
+COMMENT_PATTERNS = [
+    {
+        "name": "Modern Trac (.change divs)",
+        "container": "#changelog .change",
+        "author": [".trac-field-author", "h3.change a", ".author"],
+        "timestamp": [".trac-field-time", "a.timeline", ".date"],
+        "text": [".comment.searchable", ".comment", "div.searchable"]
+    },
+    {
+        "name": "Old Trac (h3.change headers)",
+        "container": "#changelog h3.change",
+        "author": ["a", "span"],
+        "timestamp": ["a.timeline", ".date"],
+        "text": [NEXT_SIBLING]
+    },
+    {
+        "name": "Alternative (div with class containing 'change')",
+        "container": "#changelog div[class*='change']",
+        "author": ["h3 a", ".author", "a"],
+        "timestamp": ["a.timeline", ".date", "h3 a"],
+        "text": [".comment", "div.searchable", "p"]
+    }
+]
+
+# Runs COMMENT_PATTERNS in the page. Returns null without a #changelog, else
+# [pattern name, [{author, timestamp, text}, ...], whether any container matched]
+# for the first pattern that yields a comment with an author or text.
+EXTRACT_COMMENTS_JS = """
+patterns => {
+    if (!document.getElementById('changelog')) return null;
+    const firstText = (el, selectors) => {
+        for (const selector of selectors) {
+            const found = selector === '%s' ? el.nextElementSibling : el.querySelector(selector);
+            if (found && found.textContent) return found.textContent.trim();
+        }
+        return '';
+    };
+    let containersFound = false;
+    for (const pattern of patterns) {
+        const comments = [];
+        for (const el of document.querySelectorAll(pattern.container)) {
+            containersFound = true;
+            const comment = {
+                author: firstText(el, pattern.author),
+                timestamp: firstText(el, pattern.timestamp),
+                text: firstText(el, pattern.text)
+            };
+            if (comment.author || comment.text) comments.push(comment);
+        }
+        if (comments.length) return [pattern.name, comments, true];
+    }
+    return [null, [], containersFound];
+}
+""" % NEXT_SIBLING
+
+# Fallback lists, most specific first. These are not folded into one CSS union
+# because a union matches in document order rather than by priority.
+SUMMARY_SELECTORS = [
+    "#ticket h1.summary",
+    "h1.summary",
+    "#content h1",
+    "h1",
+    "#ticket .summary"
+]
+DESCRIPTION_SELECTORS = [
+    "#ticket .description .searchable",
+    ".description .searchable",
+    "#ticket .description",
+    ".description",
+    "div.description"
+]
+ATTACHMENT_LINK_SELECTORS = [
+    "#attachments dt a",
+    "#attachments a",
+    "dl#attachments dt a"
+]
+
+# Walk a selector list inside the page and return [selector, textContent] for
+# the first element with any text, or null - the whole list in one round-trip
+FIRST_TEXT_JS = """
+selectors => {
+    for (const selector of selectors) {
+        const el = document.querySelector(selector);
+        if (el && el.textContent) return [selector, el.textContent];
+    }
+    return null;
+}
+"""
+
+# Same idea for link lists: [selector, [[text, href], ...]] for the first
+# selector that matches anything, or [null, []]
+FIRST_LINKS_JS = """
+selectors => {
+    for (const selector of selectors) {
+        const links = document.querySelectorAll(selector);
+        if (links.length) {
+            return [selector, Array.from(links, a => [a.textContent, a.getAttribute('href')])];
+        }
+    }
+    return [null, []];
+}
+"""
+
+
+def _block_subresources(route):
+    """Route handler: block_subresources, but attachment downloads always go through."""
+    url = route.request.url
+    if 'raw-attachment' in url or 'format=raw' in url:
+        return route.continue_()
+    return block_subresources(route)
+
+
+async def _stream_to_file(client: httpx.AsyncClient, url: str, save_path: Path):
     """
-    Scrape a Trac ticket and save all information to JSON with attachments.
-    Supports both old (0.11, 0.12) and new Trac versions.
+    Stream `url` into save_path DOWNLOAD_CHUNK bytes at a time, so memory stays
+    flat whatever the attachment size. Raises on a non-2xx response; a partial
+    file is removed if the transfer fails midway.
+    """
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        # open/close can block on slow disks too, so they go to a thread like the writes
+        f = await asyncio.to_thread(open, save_path, 'wb')
+        try:
+            try:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+        except BaseException:
+            save_path.unlink(missing_ok=True)
+            raise
+
+
+async def _borrow_page(context, page_pool: list):
+    """Take an idle page from page_pool, opening a new one if none is free."""
+    if page_pool:
+        return page_pool.pop()
+    page = await context.new_page()
+    page.set_default_timeout(60000)
+    return page
+
+
+async def _fetch_attachment(context, client: httpx.AsyncClient, base_url: str,
+                            attachment_page_url: str, filename: str, sem: asyncio.Semaphore,
+                            page_pool: list, attachments_dir: Path, output_path: Path):
+    """
+    Download one attachment and return its record for ticket_data.
+
+    Streams the /raw-attachment/ URL straight to disk through `client`, which
+    carries the browser context's cookies; the attachment page is only opened
+    when that fails, on a page borrowed from `page_pool` and returned to it
+    afterwards. Holds a slot of `sem` for the whole download so at most
+    ATTACHMENT_CONCURRENCY downloads (and download pages) exist at a time.
+    """
+    async with sem:
+        logger.info("  Processing attachment: %s", filename)
+        logger.debug("    Attachment page: %s", attachment_page_url)
+
+        save_path = attachments_dir / filename
+
+        # Trac serves the file itself at /raw-attachment/..., so try that
+        # directly and only open the attachment page if it doesn't work
+        raw_url = _raw_attachment_url(attachment_page_url)
+        if raw_url:
+            try:
+                await _stream_to_file(client, raw_url, save_path)
+                logger.info("    ✓ Saved to: %s", save_path)
+                return {
+                    "filename": filename,
+                    "attachment_page_url": attachment_page_url,
+                    "download_url": raw_url,
+                    "local_path": str(save_path.relative_to(output_path))
+                }
+            except Exception as e:
+                logger.warning("    Raw URL failed (%s), using the attachment page", e)
+
+        download_page = None
+        download_url = None
+
+        # Download the attachment
+        try:
+            if context is None:
+                raise RuntimeError("no browser to open the attachment page")
+            download_page = await _borrow_page(context, page_pool)
+
+            # Navigate to the attachment page
+            logger.debug("    Loading attachment page...")
+            await download_page.goto(attachment_page_url, wait_until="domcontentloaded")
+            try:
+                await download_page.wait_for_selector(ATTACHMENT_READY_SELECTOR, state="attached", timeout=10000)
+            except Exception:
+                pass  # the link patterns below still get a chance
+
+            # Look for download links on the attachment page
+            # Trac typically has links like:
+            # - "Original Format" or "Download"
+            # - URL format: /raw-attachment/ticket/XXXX/filename
+            # - Or direct format: /attachment/ticket/XXXX/filename?format=raw
+
+            # Try multiple strategies to find the download link
+            download_link_patterns = [
+                # Pattern 1: Look for raw-attachment link
+                "a[href*='raw-attachment']",
+                # Pattern 2: Look for format=raw parameter
+                "a[href*='format=raw']",
+                # Pattern 3: Look for "Download" or "Original Format" text
+                "a:has-text('Download')",
+                "a:has-text('Original Format')",
+                "a:has-text('download')",
+                # Pattern 4: Look in the attachment info div
+                "#content .attachment a",
+                ".attachment a"
+            ]
+
+            for pattern in download_link_patterns:
+                try:
+                    links = await download_page.locator(pattern).all()
+                    for link in links:
+                        link_href = await link.get_attribute("href")
+                        if link_href and (
+                            'raw-attachment' in link_href or
+                            'format=raw' in link_href or
+                            link_href.endswith(filename)
+                        ):
+                            if link_href.startswith('/'):
+                                download_url = base_url + link_href
+                            else:
+                                download_url = link_href
+                            logger.debug("    Found download link using pattern: %s", pattern)
+                            break
+                    if download_url:
+                        break
+                except:
+                    continue
+
+            # If no direct download link found, try adding format=raw to current URL
+            if not download_url:
+                logger.debug("    No direct download link found, trying format=raw parameter")
+                if '?' in attachment_page_url:
+                    download_url = attachment_page_url + '&format=raw'
+                else:
+                    download_url = attachment_page_url + '?format=raw'
+
+            logger.debug("    Download URL: %s", download_url)
+
+            # Now actually download the file
+            async with download_page.expect_download(timeout=60000) as download_info:
+                await download_page.goto(download_url)
+
+            download = await download_info.value
+
+            # Save the file
+            await download.save_as(str(save_path))
+
+            logger.info("    ✓ Saved to: %s", save_path)
+            return {
+                "filename": filename,
+                "attachment_page_url": attachment_page_url,
+                "download_url": download_url,
+                "local_path": str(save_path.relative_to(output_path))
+            }
+
+        except Exception as e:
+            logger.warning("    ✗ Error downloading %s: %s", filename, e)
+
+            # Try alternative method: direct HTTP download
+            try:
+                logger.info("    Trying alternative download method...")
+                await _stream_to_file(client, download_url if download_url else attachment_page_url + '?format=raw', save_path)
+
+                logger.info("    ✓ Saved via HTTP request to: %s", save_path)
+                return {
+                    "filename": filename,
+                    "attachment_page_url": attachment_page_url,
+                    "download_url": download_url,
+                    "local_path": str(save_path.relative_to(output_path)),
+                    "method": "http_request"
+                }
+            except Exception as e2:
+                logger.warning("    ✗ Alternative method also failed: %s", e2)
+                return {
+                    "filename": filename,
+                    "attachment_page_url": attachment_page_url,
+                    "download_url": download_url if download_url else "not_found",
+                    "error": str(e)
+                }
+
+        finally:
+            if download_page is not None:
+                page_pool.append(download_page)
+
+
+def _validators(headers) -> dict:
+    """Pick the ETag / Last-Modified headers out of a response header mapping."""
+    return {name: headers[name] for name in VALIDATOR_HEADERS if headers.get(name)}
+
+
+async def _load_cached(client: httpx.AsyncClient, url: str, output_path: Path, max_age: float):
+    """
+    Return the saved ticket_data for `url` if it can stand in for a fresh scrape.
+
+    A JSON that recorded ETag / Last-Modified is revalidated with a conditional
+    HEAD whatever its age: a 304 (or the same validators back) reuses it and
+    restarts its age, changed validators force a re-scrape. Without validators,
+    or when the HEAD fails, the file is trusted while younger than `max_age`
+    seconds. A compressed ticket_<n>.json.zst is used when that's what was
+    saved. Returns None on a miss (or when max_age <= 0).
+    """
+    ticket_match = _TICKET_RE.search(url)
+    if max_age <= 0 or not ticket_match:
+        return None
     
-    Args:
-        url: URL of the Trac ticket
-        output_dir: Directory to save output files
-        headless: Whether to run browser in headless mode
+    cache_file = _ticket_path(output_path, ticket_match.group(1), compress=True)
+    if zstandard is None or not cache_file.exists():
+        cache_file = _ticket_path(output_path, ticket_match.group(1))
+    try:
+        fresh = time.time() - cache_file.stat().st_mtime <= max_age
+        cached = await asyncio.to_thread(load_ticket, cache_file)
+    except (OSError, ValueError):
+        return None
+    
+    saved = cached.get("http_validators")
+    if saved:
+        conditional = {CONDITIONAL_HEADERS[name]: value for name, value in saved.items()
+                       if name in CONDITIONAL_HEADERS}
+        try:
+            response = await client.head(url, headers=conditional, timeout=15)
+        except httpx.HTTPError:
+            response = None
+        if response is not None:
+            current = _validators(response.headers)
+            if response.status_code == 304 or (response.status_code == 200 and current == saved):
+                logger.info("Ticket unchanged on server, using cached data: %s", cache_file)
+                await asyncio.to_thread(os.utime, cache_file)
+                return cached
+            if response.status_code == 200 and current:
+                logger.info("Ticket changed since last scrape: %s", url)
+                return None
+    
+    if not fresh:
+        return None
+    logger.info("Using cached ticket data: %s", cache_file)
+    return cached
+
+
+async def _extract_fields(page) -> dict:
+    """Read the ticket's property table (plus stray .trac-field-* values if it's sparse)."""
+    logger.info("Extracting ticket fields...")
+    fields = {}
+    try:
+        # Wait for the properties table to be visible
+        await page.wait_for_selector("#properties", timeout=10000)
+
+        # Every row is read in the page in a single call
+        rows_fields = await page.locator(PROPERTY_ROWS_SELECTOR).evaluate_all(EXTRACT_ROWS_JS)
+        logger.debug("  Found %d property rows", len(rows_fields))
+
+        # Merge the fields from each row
+        for row_fields in rows_fields:
+            for field_name, field_value in row_fields.items():
+                fields[field_name] = field_value
+                logger.debug("    %s: %s", field_name, field_value)
+
+        logger.info("  Total fields extracted: %d", len(fields))
+
+        # Also try to extract fields that might be elsewhere
+        # Some Trac versions have fields in different locations
+        if len(fields) < 5:  # Only if we didn't get many fields
+            logger.debug("  Looking for additional fields outside main table...")
+
+            # One round-trip for every probe, and no per-selector timeouts
+            found = await page.evaluate(QUERY_TEXTS_JS, ADDITIONAL_FIELD_SELECTORS)
+            for field_name, elem in found:
+                if elem and elem.strip():
+                    if field_name not in fields:
+                        fields[field_name] = elem.strip()
+                        logger.debug("    Found additional field: %s: %s", field_name, elem.strip())
+
+    except Exception as e:
+        logger.warning("Error extracting fields: %s", e)
+    
+    return fields
+
+
+async def _extract_summary(page):
+    """Return the ticket title, or None if no summary selector matches."""
+    try:
+        found = await page.evaluate(FIRST_TEXT_JS, SUMMARY_SELECTORS)
+        if found:
+            selector, summary = found
+            logger.debug("Found summary using: %s", selector)
+            return summary.strip()
+    except Exception as e:
+        logger.warning("Error extracting summary: %s", e)
+    return None
+
+
+async def _extract_description(page) -> str:
+    """Return the ticket description text, or "" if there is none."""
+    logger.info("Extracting description...")
+    try:
+        found = await page.evaluate(FIRST_TEXT_JS, DESCRIPTION_SELECTORS)
+        if found:
+            selector, description = found
+            logger.debug("  Found description (%d chars) using: %s", len(description), selector)
+            return description.strip()
+    except Exception as e:
+        logger.warning("Error extracting description: %s", e)
+    return ""
+
+
+async def _extract_comments(page, output_path: Path, ticket_number: str, debug: bool = False) -> list:
     """
-    # Create output directory structure
-    output_path = Path(output_dir)
-    output_path.mkdir(exist_ok=True)
+    Return the ticket's comments from #changelog, trying each of
+    COMMENT_PATTERNS in turn inside the page (one round-trip). If no pattern
+    matches anything and `debug` is set, the changelog HTML is dumped next to
+    the output for inspection.
+    """
+    logger.info("Extracting comments...")
+    comments = []
+    try:
+        found = await page.evaluate(EXTRACT_COMMENTS_JS, COMMENT_PATTERNS)
+        
+        if found is None:
+            logger.info("  No #changelog element found on page")
+        else:
+            pattern_name, raw_comments, containers_found = found
+            if raw_comments:
+                logger.debug("  Found %d comments using pattern: %s", len(raw_comments), pattern_name)
+            
+            for comment_number, comment_data in enumerate(raw_comments, 1):
+                comment_data = {"comment_number": comment_number, **comment_data}
+                comments.append(comment_data)
+                logger.debug("    Comment %d: author='%s...' text=%d chars", comment_data['comment_number'], comment_data['author'][:30], len(comment_data['text']))
+            
+            if not containers_found:
+                logger.info("  No comments found with any pattern")
+            
+            if not containers_found and debug:
+                # Last resort: dump the changelog HTML for manual inspection
+                try:
+                    changelog_html = await page.locator("#changelog").inner_html()
+                    debug_file = output_path / f"changelog_debug_{ticket_number}.html"
+                    await asyncio.to_thread(debug_file.write_text, changelog_html, encoding="utf-8")
+                    logger.info("  Saved changelog HTML to: %s", debug_file)
+                except:
+                    pass
     
-    attachments_dir = output_path / "attachments"
-    attachments_dir.mkdir(exist_ok=True)
+    except Exception as e:
+        logger.warning("Error extracting comments: %s", e)
     
-    async with async_playwright() as p:
-        # Launch browser with stealth settings
-        browser = await p.chromium.launch(
-            headless=headless,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,site-per-process'
-            ]
+    logger.info("Total comments extracted: %d", len(comments))
+    return comments
+
+
+# XPath twins of the CSS selectors used on the Playwright path, for the
+# plain-HTTP fast path. Lists are tried in order; the first non-empty match wins.
+# Like a scoped querySelector, a descendant step may be anchored on the scope
+# element itself or above it, hence the ancestor:: tests.
+XP_PROPERTY_ROWS = etree.XPath("//*[@id='properties']//tr")
+XP_ADDITIONAL_FIELDS = [
+    (etree.XPath(f"//*[{has_class(selector.lstrip('.'))}]"), field_name)
+    for selector, field_name in ADDITIONAL_FIELD_SELECTORS
+]
+XP_SUMMARY = [
+    etree.XPath(f"//*[@id='ticket']//h1[{has_class('summary')}]"),
+    etree.XPath(f"//h1[{has_class('summary')}]"),
+    etree.XPath("//*[@id='content']//h1"),
+    etree.XPath("//h1"),
+    etree.XPath(f"//*[@id='ticket']//*[{has_class('summary')}]"),
+]
+XP_DESCRIPTION = [
+    etree.XPath(f"//*[@id='ticket']//*[{has_class('description')}]//*[{has_class('searchable')}]"),
+    etree.XPath(f"//*[{has_class('description')}]//*[{has_class('searchable')}]"),
+    etree.XPath(f"//*[@id='ticket']//*[{has_class('description')}]"),
+    etree.XPath(f"//*[{has_class('description')}]"),
+]
+XP_FOOTER = etree.XPath("//*[@id='footer']")
+XP_COMMENT_PATTERNS = [
+    {
+        "container": etree.XPath(f"//*[@id='changelog']//*[{has_class('change')}]"),
+        "author": [etree.XPath(f".//*[{has_class('trac-field-author')}]"),
+                   etree.XPath(f".//a[ancestor::h3[{has_class('change')}]]"),
+                   etree.XPath(f".//*[{has_class('author')}]")],
+        "timestamp": [etree.XPath(f".//*[{has_class('trac-field-time')}]"),
+                      etree.XPath(f".//a[{has_class('timeline')}]"),
+                      etree.XPath(f".//*[{has_class('date')}]")],
+        "text": [etree.XPath(f".//*[{has_class('comment')} and {has_class('searchable')}]"),
+                 etree.XPath(f".//*[{has_class('comment')}]"),
+                 etree.XPath(f".//div[{has_class('searchable')}]")],
+    },
+    {
+        "container": etree.XPath(f"//*[@id='changelog']//h3[{has_class('change')}]"),
+        "author": [etree.XPath(".//a"), etree.XPath(".//span")],
+        "timestamp": [etree.XPath(f".//a[{has_class('timeline')}]"),
+                      etree.XPath(f".//*[{has_class('date')}]")],
+        "text": [etree.XPath("following-sibling::*[1]")],
+    },
+    {
+        "container": etree.XPath("//*[@id='changelog']//div[contains(@class, 'change')]"),
+        "author": [etree.XPath(".//a[ancestor::h3]"),
+                   etree.XPath(f".//*[{has_class('author')}]"),
+                   etree.XPath(".//a")],
+        "timestamp": [etree.XPath(f".//a[{has_class('timeline')}]"),
+                      etree.XPath(f".//*[{has_class('date')}]"),
+                      etree.XPath(".//a[ancestor::h3]")],
+        "text": [etree.XPath(f".//*[{has_class('comment')}]"),
+                 etree.XPath(f".//div[{has_class('searchable')}]"),
+                 etree.XPath(".//p")],
+    },
+]
+XP_ATTACHMENT_LINKS = [
+    etree.XPath("//*[@id='attachments']//dt//a"),
+    etree.XPath("//*[@id='attachments']//a"),
+]
+
+
+def _first_text(node, xpaths):
+    """Stripped text of the first element matched by the first xpath whose match has any text."""
+    for xp in xpaths:
+        found = xp(node)
+        if found:
+            text = found[0].text_content()
+            if text:
+                return text.strip()
+    return None
+
+
+def _row_fields(row) -> dict:
+    """lxml counterpart of EXTRACT_ROW_JS."""
+    fields = {}
+    cells = [child for child in row if isinstance(child.tag, str)]
+    i = 0
+    while i < len(cells) - 1:
+        th, td = cells[i], cells[i + 1]
+        if th.tag != "th" or td.tag != "td":
+            i += 1
+            continue
+        header = th.text_content().strip().rstrip(':').lower()
+        select = td.find(".//select")
+        text_input = td.find(".//input[@type='text']")
+        textarea = td.find(".//textarea")
+        if select is not None:
+            options = select.findall(".//option")
+            selected = select.find(".//option[@selected]")
+            if selected is not None:
+                value = selected.text_content().strip() or options[0].text_content()
+            else:
+                value = options[0].text_content() if options else ""
+        elif text_input is not None:
+            value = text_input.get("value", "")
+        elif textarea is not None:
+            value = textarea.text_content()
+        else:
+            value = td.text_content()
+        value = value.strip()
+        if header and value:
+            fields[header] = value
+        i += 2
+    return fields
+
+
+def _fields_from_tree(doc) -> dict:
+    """lxml counterpart of _extract_fields()."""
+    fields = {}
+    for row in XP_PROPERTY_ROWS(doc):
+        fields.update(_row_fields(row))
+    if len(fields) < 5:
+        for xp, field_name in XP_ADDITIONAL_FIELDS:
+            found = xp(doc)
+            value = found[0].text_content().strip() if found else ""
+            if value and field_name not in fields:
+                fields[field_name] = value
+    return fields
+
+
+def _comments_from_tree(doc) -> list:
+    """lxml counterpart of _extract_comments()."""
+    comments = []
+    for pattern in XP_COMMENT_PATTERNS:
+        for container in pattern["container"](doc):
+            author = _first_text(container, pattern["author"]) or ""
+            text = _first_text(container, pattern["text"]) or ""
+            if author or text:
+                comments.append({
+                    "comment_number": len(comments) + 1,
+                    "author": author,
+                    "timestamp": _first_text(container, pattern["timestamp"]) or "",
+                    "text": text
+                })
+        if comments:
+            break
+    return comments
+
+
+def _attachment_listing(doc, base_url: str) -> list:
+    """(filename, attachment page URL) pairs from the #attachments list."""
+    for xp in XP_ATTACHMENT_LINKS:
+        links = xp(doc)
+        if links:
+            break
+    pending = []
+    for link in links:
+        filename = link.text_content().strip()
+        href = link.get("href")
+        if filename and href:
+            pending.append((filename, base_url + href if href.startswith('/') else href))
+    return pending
+
+
+def _new_ticket_data(url: str, headers) -> dict:
+    """Empty ticket_data for `url`, carrying the page's cache validators if it sent any."""
+    ticket_match = _TICKET_RE.search(url)
+    ticket_data = {
+        "url": url,
+        "ticket_number": ticket_match.group(1) if ticket_match else "unknown",
+        "scraped_at": datetime.now().isoformat(),
+        "fields": {},
+        "description": "",
+        "comments": [],
+        "attachments": []
+    }
+    # Kept so the next run can tell whether the ticket changed
+    if headers is not None and (validators := _validators(headers)):
+        ticket_data["http_validators"] = validators
+    return ticket_data
+
+
+async def _download_attachments(context, client: httpx.AsyncClient, pending: list,
+                                 base_url: str, attachments_dir: Path, output_path: Path) -> list:
+    """
+    Download every (filename, attachment page URL) in `pending` concurrently and
+    return their records in the same order. `context` may be None, in which
+    case only the direct HTTP routes are tried.
+    """
+    sem = asyncio.Semaphore(ATTACHMENT_CONCURRENCY)
+    page_pool = []  # download pages, reused across attachments
+    try:
+        results = await asyncio.gather(
+            *(_fetch_attachment(context, client, base_url, attachment_page_url, filename,
+                                sem, page_pool, attachments_dir, output_path)
+              for filename, attachment_page_url in pending),
+            return_exceptions=True
         )
-        
-        # Create context with realistic settings
-        context = await browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/New_York',
-            permissions=['geolocation'],
-            color_scheme='light',
-            extra_http_headers={
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1'
+    finally:
+        for download_page in page_pool:
+            try:
+                await download_page.close()
+            except Exception:
+                pass
+    
+    records = []
+    for (filename, attachment_page_url), result in zip(pending, results):
+        if isinstance(result, BaseException):
+            logger.warning("    ✗ Error downloading %s: %s", filename, result)
+            result = {
+                "filename": filename,
+                "attachment_page_url": attachment_page_url,
+                "download_url": "not_found",
+                "error": str(result)
             }
-        )
+        records.append(result)
+    return records
+
+
+def _decode_ticket(data: bytes) -> dict:
+    """Parse a saved ticket JSON straight from its UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _ticket_path(output_path: Path, ticket_number: str, compress: bool = False) -> Path:
+    """Where ticket <n> is saved: ticket_<n>.json, or ticket_<n>.json.zst compressed."""
+    return output_path / f"ticket_{ticket_number}.json{'.zst' if compress else ''}"
+
+
+def load_ticket(path) -> dict:
+    """Read a ticket saved by scrape_trac_ticket, zstd-compressed (.json.zst) or not."""
+    path = Path(path)
+    if path.suffix != ".zst":
+        return _decode_ticket(path.read_bytes())
+    if zstandard is None:
+        raise RuntimeError(f"reading {path} needs the zstandard package")
+    try:
+        with open(path, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            return _decode_ticket(reader.read())
+    except zstandard.ZstdError as e:
+        raise ValueError(f"corrupt zstd data in {path}: {e}") from e
+
+
+def _encode_for_save(ticket_data: dict) -> tuple:
+    """
+    Encode ticket_data for saving; returns (payload, content hash).
+
+    The hash covers everything but scraped_at, which differs on every run and
+    would never let a re-scrape match.
+    """
+    content = json_bytes({key: value for key, value in ticket_data.items()
+                          if key != "scraped_at"})
+    digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+    if "scraped_at" not in ticket_data:
+        return content, digest
+    return json_bytes(ticket_data), digest
+
+
+async def _save_ticket(ticket_data: dict, output_path: Path, compress: bool = False):
+    """
+    Write ticket_data to ticket_<n>.json (or .json.zst with `compress`) off the
+    event loop and log the totals. The other variant, if left over from an
+    earlier run, is removed so it can't shadow this one in the cache.
+
+    A <file>.hash sidecar records the content hash; when it still matches, the
+    saved file is only touched (restarting its cache age) instead of rewritten.
+    """
+    json_path = _ticket_path(output_path, ticket_data['ticket_number'], compress)
+    hash_path = json_path.with_name(json_path.name + ".hash")
+    big = len(ticket_data['comments']) > THREADED_ENCODE_COMMENTS
+    payload, digest = (await asyncio.to_thread(_encode_for_save, ticket_data) if big
+                       else _encode_for_save(ticket_data))
+    try:
+        unchanged = (json_path.exists()
+                     and await asyncio.to_thread(hash_path.read_text) == digest)
+    except OSError:
+        unchanged = False
+    
+    if unchanged:
+        await asyncio.to_thread(os.utime, json_path)
+    else:
+        if compress:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+            payload = await asyncio.to_thread(compressor.compress, payload)
+        await asyncio.to_thread(json_path.write_bytes, payload)
+        await asyncio.to_thread(hash_path.write_text, digest)
+    stale = _ticket_path(output_path, ticket_data['ticket_number'], not compress)
+    for leftover in (stale, stale.with_name(stale.name + ".hash")):
+        await asyncio.to_thread(leftover.unlink, missing_ok=True)
+    
+    # One record rather than four, so concurrent tickets' totals don't interleave
+    logger.info("✓ Ticket data %s: %s\n"
+                "✓ Total fields extracted: %d\n"
+                "✓ Total comments extracted: %d\n"
+                "✓ Total attachments: %d",
+                "unchanged, kept" if unchanged else "saved to", json_path,
+                len(ticket_data['fields']), len(ticket_data['comments']),
+                len(ticket_data['attachments']))
+
+
+async def _scrape_http(client: httpx.AsyncClient, url: str, output_path: Path,
+                       compress: bool = False):
+    """
+    Scrape a ticket from its server-rendered HTML with httpx + lxml, no browser.
+
+    Returns None, leaving the ticket to the Playwright path, when the page
+    can't be fetched or parsed, or yields fewer than MIN_HTTP_FIELDS fields. Attachments
+    are downloaded over the same client.
+    """
+    logger.info("Fetching ticket over HTTP: %s", url)
+    try:
+        response = await client.get(url)
+    except httpx.HTTPError as e:
+        logger.info("  ↪ HTTP fetch failed (%r); using the browser", e)
+        return None
+    if response.status_code != 200:
+        logger.info("  ↪ HTTP %d; using the browser", response.status_code)
+        return None
+    
+    try:
+        doc = lh.fromstring(response.content)
+    except (etree.ParserError, ValueError) as e:
+        logger.info("  ↪ Unparseable HTML (%s); using the browser", e)
+        return None
+    fields = _fields_from_tree(doc)
+    if len(fields) < MIN_HTTP_FIELDS:
+        logger.info("  ↪ Only %d fields in the HTML; using the browser", len(fields))
+        return None
+    
+    ticket_data = _new_ticket_data(url, response.headers)
+    footer = XP_FOOTER(doc)
+    version_match = footer and _TRAC_VERSION_RE.search(footer[0].text_content())
+    if version_match:
+        ticket_data["trac_version"] = version_match.group(1)
+    
+    summary = _first_text(doc, XP_SUMMARY)
+    if summary:
+        fields["summary"] = summary
+    ticket_data["fields"] = fields
+    ticket_data["description"] = _first_text(doc, XP_DESCRIPTION) or ""
+    ticket_data["comments"] = _comments_from_tree(doc)
+    
+    base_url = '/'.join(url.split('/')[:3])
+    pending = _attachment_listing(doc, base_url)
+    ticket_data["attachments"] = await _download_attachments(
+        None, client, pending, base_url, output_path / "attachments", output_path)
+    
+    await _save_ticket(ticket_data, output_path, compress)
+    return ticket_data
+
+
+def _http_client() -> httpx.AsyncClient:
+    """The HTTP/2 client shared by everything one scrape run fetches outside the browser."""
+    return httpx.AsyncClient(http2=True, headers=HTTP_HEADERS, limits=HTTP_LIMITS,
+                             follow_redirects=True, timeout=60)
+
+
+def _check_compress(compress: bool):
+    """Fail before any scraping when compressed output is asked for but unavailable."""
+    if compress and zstandard is None:
+        raise RuntimeError("compress=True needs the zstandard package")
+
+
+def _prepare_output(output_dir: str) -> Path:
+    """Create output_dir and its attachments/ subdirectory."""
+    output_path = Path(output_dir)
+    output_path.mkdir(exist_ok=True)
+    (output_path / "attachments").mkdir(exist_ok=True)
+    return output_path
+
+
+async def _init_browser(p, headless: bool):
+    """Launch Chromium and create the stealth context shared by every ticket."""
+    # Launch browser with stealth settings
+    browser = await p.chromium.launch(
+        headless=headless,
+        args=[
+            '--disable-blink-features=AutomationControlled',
+            '--disable-dev-shm-usage',
+            '--no-sandbox',
+            '--disable-setuid-sandbox',
+            '--disable-web-security',
+            '--disable-features=IsolateOrigins,site-per-process'
+        ]
+    )
+    
+    # Create context with realistic settings
+    context = await browser.new_context(
+        viewport={'width': 1920, 'height': 1080},
+        user_agent=USER_AGENT,
+        locale='en-US',
+        timezone_id='America/New_York',
+        permissions=['geolocation'],
+        color_scheme='light',
+        extra_http_headers={
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1'
+        }
+    )
+    await context.route("**/*", _block_subresources)
+    
+    # Add stealth JavaScript to hide automation
+    await context.add_init_script("""
+        Object.defineProperty(navigator, 'webdriver', {
+            get: () => undefined
+        });
         
-        page = await context.new_page()
+        Object.defineProperty(navigator, 'plugins', {
+            get: () => [1, 2, 3, 4, 5]
+        });
         
-        # Set default timeout to 60 seconds
-        page.set_default_timeout(60000)
+        Object.defineProperty(navigator, 'languages', {
+            get: () => ['en-US', 'en']
+        });
         
-        # Add stealth JavaScript to hide automation
-        await page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-            
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['en-US', 'en']
-            });
-            
-            window.chrome = {
-                runtime: {}
-            };
-            
-            const originalQuery = window.navigator.permissions.query;
-            window.navigator.permissions.query = (parameters) => (
-                parameters.name === 'notifications' ?
-                    Promise.resolve({ state: Notification.permission }) :
-                    originalQuery(parameters)
-            );
-        """)
+        window.chrome = {
+            runtime: {}
+        };
         
-        print(f"Loading ticket: {url}")
+        const originalQuery = window.navigator.permissions.query;
+        window.navigator.permissions.query = (parameters) => (
+            parameters.name === 'notifications' ?
+                Promise.resolve({ state: Notification.permission }) :
+                originalQuery(parameters)
+        );
+    """)
+    
+    return browser, context
+
+
+async def _scrape_one(context, client: httpx.AsyncClient, url: str, output_path: Path,
+                      debug: bool = False, page_pool: list = None, compress: bool = False):
+    """
+    Scrape one ticket on a page of `context` and save it under output_path.
+    With `page_pool` the page is borrowed from it and handed back for the next
+    ticket unless the scrape failed; otherwise it is opened and closed here.
+    With `debug`, also save a screenshot and, if no comments parse, the changelog HTML.
+    """
+    attachments_dir = output_path / "attachments"
+    
+    page = await _borrow_page(context, page_pool if page_pool is not None else [])
+    reusable = False
+    try:
+        logger.info("Loading ticket: %s", url)
         try:
-            await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            # Wait a bit for any dynamic content
-            await page.wait_for_timeout(2000)
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
         except Exception as e:
-            print(f"Error loading page: {e}")
-            print("Trying with a longer timeout...")
-            await page.goto(url, timeout=90000)
-            await page.wait_for_timeout(3000)
+            logger.warning("Error loading page: %s", e)
+            logger.warning("Trying with a longer timeout...")
+            response = await page.goto(url, timeout=90000)
         
-        # Extract ticket number from URL
-        ticket_match = re.search(r'/ticket/(\d+)', url)
-        ticket_number = ticket_match.group(1) if ticket_match else "unknown"
+        # Trac renders tickets server-side, so once the ticket container is
+        # in the DOM there's nothing left to wait for
+        try:
+            await page.wait_for_selector(TICKET_READY_SELECTOR, state="attached", timeout=15000)
+        except Exception as e:
+            logger.warning("Ticket content not found, extracting anyway: %s", e)
         
-        ticket_data = {
-            "url": url,
-            "ticket_number": ticket_number,
-            "scraped_at": datetime.now().isoformat(),
-            "fields": {},
-            "description": "",
-            "comments": [],
-            "attachments": []
-        }
+        ticket_data = _new_ticket_data(url, response.headers if response is not None else None)
+        ticket_number = ticket_data["ticket_number"]
         
         # Detect Trac version
-        print("Detecting Trac version...")
+        logger.debug("Detecting Trac version...")
         trac_version = "unknown"
         try:
             footer_text = await page.locator("#footer").text_content(timeout=5000)
             if footer_text:
-                version_match = re.search(r'Trac\s+([\d.]+)', footer_text)
+                version_match = _TRAC_VERSION_RE.search(footer_text)
                 if version_match:
                     trac_version = version_match.group(1)
-                    print(f"  Detected Trac version: {trac_version}")
+                    logger.debug("  Detected Trac version: %s", trac_version)
                     ticket_data["trac_version"] = trac_version
         except:
             pass
         
-        # Take a screenshot for debugging
-        await page.screenshot(path=str(output_path / f"screenshot_{ticket_number}.png"))
-        print(f"Screenshot saved for debugging")
+        if debug:
+            await page.screenshot(path=str(output_path / f"screenshot_{ticket_number}.png"))
+            logger.debug("Screenshot saved for debugging")
         
-        # Extract ticket fields from the property table
-        print("Extracting ticket fields...")
-        
-        async def extract_fields_from_row(row):
-            """Extract field-value pairs from a table row, getting selected values from dropdowns."""
-            fields = {}
-            try:
-                # Get all direct children of the row in order
-                children = await row.locator("> *").all()
-                
-                if not children:
-                    return fields
-                
-                # Process children sequentially, looking for th-td pairs
-                i = 0
-                while i < len(children):
-                    try:
-                        current_tag = await children[i].evaluate("el => el.tagName.toLowerCase()")
-                        
-                        if current_tag == "th":
-                            header_text = await children[i].text_content()
-                            header_clean = header_text.strip().rstrip(':').lower()
-                            
-                            # Look for the corresponding td
-                            if i + 1 < len(children):
-                                next_tag = await children[i+1].evaluate("el => el.tagName.toLowerCase()")
-                                
-                                if next_tag == "td":
-                                    td_elem = children[i+1]
-                                    
-                                    # Check what type of content this td has
-                                    has_select = await td_elem.locator("select").count() > 0
-                                    has_input = await td_elem.locator("input[type='text']").count() > 0
-                                    has_textarea = await td_elem.locator("textarea").count() > 0
-                                    
-                                    value_clean = None
-                                    
-                                    if has_select:
-                                        # Extract the SELECTED option from the dropdown
-                                        try:
-                                            selected_option = await td_elem.locator("select option[selected]").first.text_content(timeout=1000)
-                                            if selected_option:
-                                                value_clean = selected_option.strip()
-                                            else:
-                                                # If no option is marked as selected, get the first one (default)
-                                                first_option = await td_elem.locator("select option").first.text_content(timeout=1000)
-                                                if first_option:
-                                                    value_clean = first_option.strip()
-                                        except:
-                                            # Fallback: try to get the selected value via JavaScript
-                                            try:
-                                                value_clean = await td_elem.locator("select").first.evaluate("el => el.options[el.selectedIndex]?.text")
-                                                if value_clean:
-                                                    value_clean = value_clean.strip()
-                                            except:
-                                                pass
-                                    
-                                    elif has_input:
-                                        # Extract value from input field
-                                        try:
-                                            input_value = await td_elem.locator("input[type='text']").first.get_attribute("value")
-                                            if input_value:
-                                                value_clean = input_value.strip()
-                                        except:
-                                            pass
-                                    
-                                    elif has_textarea:
-                                        # Extract value from textarea
-                                        try:
-                                            textarea_value = await td_elem.locator("textarea").first.text_content()
-                                            if textarea_value:
-                                                value_clean = textarea_value.strip()
-                                        except:
-                                            pass
-                                    
-                                    else:
-                                        # Plain text cell (display value)
-                                        value_text = await td_elem.text_content()
-                                        value_clean = value_text.strip()
-                                    
-                                    if header_clean and value_clean:
-                                        fields[header_clean] = value_clean
-                                    
-                                    i += 2  # Skip both th and td
-                                    continue
-                        
-                        i += 1
-                        
-                    except:
-                        i += 1
-                        continue
-            except:
-                pass
-            
-            return fields
-        
-        try:
-            # Wait for the properties table to be visible
-            await page.wait_for_selector("#properties", timeout=10000)
-            
-            # Try multiple selector patterns for properties
-            property_selectors = [
-                "#properties table.properties tr",
-                "#properties table tr",
-                "#properties tr"
-            ]
-            
-            property_rows = []
-            for selector in property_selectors:
-                property_rows = await page.locator(selector).all()
-                if property_rows:
-                    print(f"  Found {len(property_rows)} property rows using: {selector}")
-                    break
-            
-            # Extract fields from each row
-            for row in property_rows:
-                row_fields = await extract_fields_from_row(row)
-                for field_name, field_value in row_fields.items():
-                    ticket_data["fields"][field_name] = field_value
-                    print(f"    {field_name}: {field_value}")
-                    
-            print(f"  Total fields extracted: {len(ticket_data['fields'])}")
-            
-            # Also try to extract fields that might be elsewhere
-            # Some Trac versions have fields in different locations
-            if len(ticket_data["fields"]) < 5:  # Only if we didn't get many fields
-                print("  Looking for additional fields outside main table...")
-                
-                additional_field_patterns = [
-                    (".trac-field-reporter", "reporter"),
-                    (".reporter", "reporter"),
-                    (".trac-field-owner", "owner"),
-                    (".owner", "owner"),
-                    (".trac-field-status", "status"),
-                    (".status", "status"),
-                    (".trac-field-priority", "priority"),
-                    (".trac-field-component", "component"),
-                    (".trac-field-version", "version"),
-                    (".trac-field-milestone", "milestone"),
-                    (".trac-field-keywords", "keywords"),
-                    (".trac-field-cc", "cc"),
-                ]
-                
-                for selector, field_name in additional_field_patterns:
-                    try:
-                        elem = await page.locator(selector).first.text_content(timeout=2000)
-                        if elem and elem.strip():
-                            if field_name not in ticket_data["fields"]:
-                                ticket_data["fields"][field_name] = elem.strip()
-                                print(f"    Found additional field: {field_name}: {elem.strip()}")
-                    except:
-                        continue
-                    
-        except Exception as e:
-            print(f"Error extracting fields: {e}")
-        except Exception as e:
-            print(f"Error extracting fields: {e}")
-        
-        # Extract summary (title)
-        try:
-            selectors = [
-                "#ticket h1.summary",
-                "h1.summary",
-                "#content h1",
-                "h1",
-                "#ticket .summary"
-            ]
-            
-            for selector in selectors:
-                try:
-                    summary = await page.locator(selector).first.text_content(timeout=5000)
-                    if summary:
-                        ticket_data["fields"]["summary"] = summary.strip()
-                        print(f"Found summary using: {selector}")
-                        break
-                except:
-                    continue
-        except Exception as e:
-            print(f"Error extracting summary: {e}")
-        
-        # Extract description
-        print("Extracting description...")
-        try:
-            selectors = [
-                "#ticket .description .searchable",
-                ".description .searchable",
-                "#ticket .description",
-                ".description",
-                "div.description"
-            ]
-            
-            for selector in selectors:
-                try:
-                    await page.wait_for_selector(selector, timeout=5000)
-                    description = await page.locator(selector).first.text_content()
-                    if description:
-                        ticket_data["description"] = description.strip()
-                        print(f"  Found description ({len(description)} chars) using: {selector}")
-                        break
-                except:
-                    continue
-        except Exception as e:
-            print(f"Error extracting description: {e}")
-        
-        # Extract comments - THIS IS THE IMPROVED PART
-        print("Extracting comments...")
-        try:
-            # First, check if changelog exists at all
-            changelog_exists = await page.locator("#changelog").count() > 0
-            
-            if not changelog_exists:
-                print("  No #changelog element found on page")
-            else:
-                print("  Found #changelog element")
-                
-                # Try multiple patterns for comment extraction
-                comment_patterns = [
-                    {
-                        "name": "Modern Trac (.change divs)",
-                        "container": "#changelog .change",
-                        "author": [".trac-field-author", "h3.change a", ".author"],
-                        "timestamp": [".trac-field-time", "a.timeline", ".date"],
-                        "text": [".comment.searchable", ".comment", "div.searchable"]
-                    },
-                    {
-                        "name": "Old Trac (h3.change headers)",
-                        "container": "#changelog h3.change",
-                        "author": ["a", "span"],
-                        "timestamp": ["a.timeline", ".date"],
-                        "text": ["following-sibling::div[1]", "+ div"]
-                    },
-                    {
-                        "name": "Alternative (div with class containing 'change')",
-                        "container": "#changelog div[class*='change']",
-                        "author": ["h3 a", ".author", "a"],
-                        "timestamp": ["a.timeline", ".date", "h3 a"],
-                        "text": [".comment", "div.searchable", "p"]
-                    }
-                ]
-                
-                comments_found = False
-                
-                for pattern in comment_patterns:
-                    print(f"  Trying pattern: {pattern['name']}")
-                    comment_elements = await page.locator(pattern["container"]).all()
-                    
-                    if comment_elements:
-                        print(f"    Found {len(comment_elements)} potential comments")
-                        comments_found = True
-                        
-                        for idx, comment_elem in enumerate(comment_elements):
-                            comment_data = {
-                                "comment_number": len(ticket_data["comments"]) + 1,
-                                "author": "",
-                                "timestamp": "",
-                                "text": ""
-                            }
-                            
-                            # Try to get author
-                            for author_sel in pattern["author"]:
-                                try:
-                                    author = await comment_elem.locator(author_sel).first.text_content(timeout=2000)
-                                    if author:
-                                        comment_data["author"] = author.strip()
-                                        break
-                                except:
-                                    continue
-                            
-                            # Try to get timestamp
-                            for time_sel in pattern["timestamp"]:
-                                try:
-                                    timestamp = await comment_elem.locator(time_sel).first.text_content(timeout=2000)
-                                    if timestamp:
-                                        comment_data["timestamp"] = timestamp.strip()
-                                        break
-                                except:
-                                    continue
-                            
-                            # Try to get comment text
-                            for text_sel in pattern["text"]:
-                                try:
-                                    # Handle XPath-style selectors differently
-                                    if "following-sibling" in text_sel or text_sel.startswith("+"):
-                                        # Need to find next sibling
-                                        comment_text = await comment_elem.evaluate("""
-                                            el => el.nextElementSibling ? el.nextElementSibling.textContent : ''
-                                        """)
-                                    else:
-                                        comment_text = await comment_elem.locator(text_sel).first.text_content(timeout=2000)
-                                    
-                                    if comment_text:
-                                        comment_data["text"] = comment_text.strip()
-                                        break
-                                except:
-                                    continue
-                            
-                            # If we got at least author or text, add it
-                            if comment_data["author"] or comment_data["text"]:
-                                ticket_data["comments"].append(comment_data)
-                                print(f"    Comment {comment_data['comment_number']}: author='{comment_data['author'][:30]}...' text={len(comment_data['text'])} chars")
-                        
-                        if ticket_data["comments"]:
-                            break  # Found comments, stop trying other patterns
-                
-                if not comments_found:
-                    print("  No comments found with any pattern")
-                    
-                    # Last resort: dump the changelog HTML for manual inspection
-                    try:
-                        changelog_html = await page.locator("#changelog").inner_html()
-                        debug_file = output_path / f"changelog_debug_{ticket_number}.html"
-                        with open(debug_file, "w", encoding="utf-8") as f:
-                            f.write(changelog_html)
-                        print(f"  Saved changelog HTML to: {debug_file}")
-                    except:
-                        pass
-                        
-        except Exception as e:
-            print(f"Error extracting comments: {e}")
-        
-        print(f"Total comments extracted: {len(ticket_data['comments'])}")
+        # The extraction phases read disjoint parts of the page, so run them together
+        fields, summary, description, comments = await asyncio.gather(
+            _extract_fields(page),
+            _extract_summary(page),
+            _extract_description(page),
+            _extract_comments(page, output_path, ticket_number, debug)
+        )
+        if summary:
+            fields["summary"] = summary
+        ticket_data["fields"] = fields
+        ticket_data["description"] = description
+        ticket_data["comments"] = comments
         
         # Extract and download attachments
-        print("Extracting attachments...")
+        logger.info("Extracting attachments...")
         try:
-            await page.wait_for_selector("#attachments", timeout=5000)
-            
-            # Try multiple attachment selectors
-            attachment_selectors = [
-                "#attachments dt a",
-                "#attachments a",
-                "dl#attachments dt a"
-            ]
-            
-            attachments = []
-            for selector in attachment_selectors:
-                attachments = await page.locator(selector).all()
-                if attachments:
-                    print(f"  Found {len(attachments)} attachments using: {selector}")
-                    break
+            selector, attachments = await page.evaluate(FIRST_LINKS_JS, ATTACHMENT_LINK_SELECTORS)
+            if attachments:
+                logger.info("  Found %d attachments using: %s", len(attachments), selector)
+            else:
+                logger.info("  No attachments found")
             
-            for attachment in attachments:
-                filename = await attachment.text_content()
-                href = await attachment.get_attribute("href")
-                
+            # Collect the listing first, then download concurrently
+            base_url = '/'.join(url.split('/')[:3])
+            pending = []
+            for filename, href in attachments:
                 if filename and href:
                     filename = filename.strip()
                     
                     # Construct full URL if href is relative
                     if href.startswith('/'):
-                        base_url = '/'.join(url.split('/')[:3])
                         attachment_page_url = base_url + href
                     else:
                         attachment_page_url = href
                     
-                    print(f"  Processing attachment: {filename}")
-                    print(f"    Attachment page: {attachment_page_url}")
-                    
-                    # Download the attachment
-                    try:
-                        download_page = await context.new_page()
-                        download_page.set_default_timeout(60000)
-                        
-                        # Navigate to the attachment page
-                        print(f"    Loading attachment page...")
-                        await download_page.goto(attachment_page_url, wait_until="domcontentloaded")
-                        await download_page.wait_for_timeout(1000)
-                        
-                        # Look for download links on the attachment page
-                        # Trac typically has links like:
-                        # - "Original Format" or "Download" 
-                        # - URL format: /raw-attachment/ticket/XXXX/filename
-                        # - Or direct format: /attachment/ticket/XXXX/filename?format=raw
-                        
-                        download_url = None
-                        
-                        # Try multiple strategies to find the download link
-                        download_link_patterns = [
-                            # Pattern 1: Look for raw-attachment link
-                            "a[href*='raw-attachment']",
-                            # Pattern 2: Look for format=raw parameter
-                            "a[href*='format=raw']",
-                            # Pattern 3: Look for "Download" or "Original Format" text
-                            "a:has-text('Download')",
-                            "a:has-text('Original Format')",
-                            "a:has-text('download')",
-                            # Pattern 4: Look in the attachment info div
-                            "#content .attachment a",
-                            ".attachment a"
-                        ]
-                        
-                        for pattern in download_link_patterns:
-                            try:
-                                links = await download_page.locator(pattern).all()
-                                for link in links:
-                                    link_href = await link.get_attribute("href")
-                                    if link_href and (
-                                        'raw-attachment' in link_href or 
-                                        'format=raw' in link_href or
-                                        link_href.endswith(filename)
-                                    ):
-                                        if link_href.startswith('/'):
-                                            download_url = base_url + link_href
-                                        else:
-                                            download_url = link_href
-                                        print(f"    Found download link using pattern: {pattern}")
-                                        break
-                                if download_url:
-                                    break
-                            except:
-                                continue
-                        
-                        # If no direct download link found, try adding format=raw to current URL
-                        if not download_url:
-                            print(f"    No direct download link found, trying format=raw parameter")
-                            if '?' in attachment_page_url:
-                                download_url = attachment_page_url + '&format=raw'
-                            else:
-                                download_url = attachment_page_url + '?format=raw'
-                        
-                        print(f"    Download URL: {download_url}")
-                        
-                        # Now actually download the file
-                        async with download_page.expect_download(timeout=60000) as download_info:
-                            await download_page.goto(download_url)
-                        
-                        download = await download_info.value
-                        
-                        # Save the file
-                        save_path = attachments_dir / filename
-                        await download.save_as(str(save_path))
-                        
-                        await download_page.close()
-                        
-                        ticket_data["attachments"].append({
-                            "filename": filename,
-                            "attachment_page_url": attachment_page_url,
-                            "download_url": download_url,
-                            "local_path": str(save_path.relative_to(output_path))
-                        })
-                        print(f"    ✓ Saved to: {save_path}")
-                        
-                    except Exception as e:
-                        print(f"    ✗ Error downloading {filename}: {e}")
-                        
-                        # Try alternative method: direct HTTP download
-                        try:
-                            print(f"    Trying alternative download method...")
-                            response = await download_page.request.get(download_url if download_url else attachment_page_url + '?format=raw')
-                            
-                            if response.ok:
-                                content = await response.body()
-                                save_path = attachments_dir / filename
-                                with open(save_path, 'wb') as f:
-                                    f.write(content)
-                                
-                                ticket_data["attachments"].append({
-                                    "filename": filename,
-                                    "attachment_page_url": attachment_page_url,
-                                    "download_url": download_url,
-                                    "local_path": str(save_path.relative_to(output_path)),
-                                    "method": "http_request"
-                                })
-                                print(f"    ✓ Saved via HTTP request to: {save_path}")
-                            else:
-                                raise Exception(f"HTTP {response.status}")
-                        except Exception as e2:
-                            print(f"    ✗ Alternative method also failed: {e2}")
-                            ticket_data["attachments"].append({
-                                "filename": filename,
-                                "attachment_page_url": attachment_page_url,
-                                "download_url": download_url if download_url else "not_found",
-                                "error": str(e)
-                            })
-                        
-                        try:
-                            await download_page.close()
-                        except:
-                            pass
+                    pending.append((filename, attachment_page_url))
+            
+            # Direct downloads go over the shared client, carrying the browser's cookies
+            client.cookies.update({c["name"]: c["value"] for c in await context.cookies()})
+            ticket_data["attachments"] = await _download_attachments(
+                context, client, pending, base_url, attachments_dir, output_path)
                             
         except Exception as e:
-            print(f"No attachments found or error: {e}")
+            logger.warning("No attachments found or error: %s", e)
+        reusable = page_pool is not None
+    finally:
+        if reusable:
+            page_pool.append(page)
+        else:
+            await page.close()
+    
+    await _save_ticket(ticket_data, output_path, compress)
+    return ticket_data
+
+
+async def scrape_trac_ticket(url: str, output_dir: str = "ticket_data", headless: bool = True,
+                             cache_max_age: float = CACHE_MAX_AGE, debug: bool = False,
+                             compress: bool = False):
+    """
+    Scrape a Trac ticket and save all information to JSON with attachments.
+    Supports both old (0.11, 0.12) and new Trac versions.
+    
+    Args:
+        url: URL of the Trac ticket
+        output_dir: Directory to save output files
+        headless: Whether to run browser in headless mode
+        cache_max_age: Reuse a saved ticket JSON the server reports unchanged
+            (304), or one younger than this many seconds when it can't be
+            revalidated; 0 always re-scrapes
+        debug: Save a screenshot (and the changelog HTML when no comments
+            parse) for tickets scraped in the browser
+        compress: Save the ticket as zstd-compressed ticket_<n>.json.zst
+            (needs the zstandard package; read it back with load_ticket)
+    """
+    _check_compress(compress)
+    output_path = _prepare_output(output_dir)
+    
+    async with _http_client() as client:
+        cached = await _load_cached(client, url, output_path, cache_max_age)
+        if cached is not None:
+            return cached
+        
+        # Trac renders tickets server-side, so try without a browser first
+        ticket_data = await _scrape_http(client, url, output_path, compress)
+        if ticket_data is not None:
+            return ticket_data
+        
+        async with async_playwright() as p:
+            browser, context = await _init_browser(p, headless)
+            try:
+                return await _scrape_one(context, client, url, output_path, debug,
+                                         compress=compress)
+            finally:
+                await browser.close()
+
+
+async def scrape_many(urls, output_dir: str = "ticket_data", headless: bool = True,
+                      concurrency: int = 6, cache_max_age: float = CACHE_MAX_AGE,
+                      debug: bool = False, compress: bool = False):
+    """
+    Scrape several tickets over one browser and context, at most
+    `concurrency` pages at a time; each page is reused for the next ticket.
+    Results come back in `urls` order.
+    Tickets served from the cache or the plain-HTTP path (see
+    scrape_trac_ticket) are not loaded in the browser, and the browser is not
+    started at all if none is left over. One ticket failing doesn't stop the
+    others: an error in the cache or HTTP pass leaves that ticket to the
+    browser, and one in the browser is logged and returned in its place.
+    """
+    _check_compress(compress)
+    urls = list(urls)
+    output_path = _prepare_output(output_dir)
+    sem = asyncio.Semaphore(concurrency)
+    
+    async with _http_client() as client:
+        # Revalidation HEADs are bounded like every other fetch, so a long URL
+        # list can't pile up on the connection pool and time out
+        async def _cached(url):
+            async with sem:
+                return await _load_cached(client, url, output_path, cache_max_age)
+        
+        results = await asyncio.gather(*map(_cached, urls), return_exceptions=True)
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning("Cache check failed for %s (%r); scraping it", urls[i], result)
+                results[i] = None
         
-        await browser.close()
+        async def _fast(url):
+            async with sem:
+                return await _scrape_http(client, url, output_path, compress)
         
-        # Save ticket data to JSON
-        json_path = output_path / f"ticket_{ticket_number}.json"
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(ticket_data, f, indent=2, ensure_ascii=False)
+        misses = [i for i, hit in enumerate(results) if hit is None]
+        fetched = await asyncio.gather(*(_fast(urls[i]) for i in misses), return_exceptions=True)
+        for i, ticket_data in zip(misses, fetched):
+            if isinstance(ticket_data, Exception):
+                logger.warning("HTTP scrape failed for %s (%r); using the browser",
+                               urls[i], ticket_data)
+                ticket_data = None
+            results[i] = ticket_data
         
-        print(f"\n✓ Ticket data saved to: {json_path}")
-        print(f"✓ Total fields extracted: {len(ticket_data['fields'])}")
-        print(f"✓ Total comments extracted: {len(ticket_data['comments'])}")
-        print(f"✓ Total attachments: {len(ticket_data['attachments'])}")
+        misses = [i for i, hit in enumerate(results) if hit is None]
+        if not misses:
+            return results
         
-        return ticket_data
+        async with async_playwright() as p:
+            browser, context = await _init_browser(p, headless)
+            page_pool = []  # ticket pages, at most `concurrency` of them, reused across tickets
+            
+            async def _one(url):
+                async with sem:
+                    return await _scrape_one(context, client, url, output_path, debug,
+                                             page_pool, compress)
+            
+            # Every page is done with before the browser closes, failed or not
+            try:
+                scraped = await asyncio.gather(*(_one(urls[i]) for i in misses),
+                                               return_exceptions=True)
+            finally:
+                await browser.close()
+    
+    for i, ticket_data in zip(misses, scraped):
+        if isinstance(ticket_data, Exception):
+            logger.error("✗ Failed to scrape %s: %r", urls[i], ticket_data)
+        results[i] = ticket_data
+    return results
+
+
+def _start_logging(level: int = logging.INFO) -> QueueListener:
+    """
+    Send log records through a queue to a stderr handler running on a
+    background thread, so formatting and terminal writes never stall the
+    event loop. Returns the started listener; stop() it to flush on exit.
+    """
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stderr))
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    # httpx logs every request at INFO; only its problems are interesting here
+    logging.getLogger("httpx").setLevel(max(level, logging.WARNING))
+    listener.start()
+    return listener
+
+
+# (field name, label) pairs printed under "Key Fields" in main's summary
+_SUMMARY_FIELDS = (
+    ('reported by', 'Reported By'),
+    ('priority', 'Priority'),
+    ('component', 'Component'),
+    ('version', 'Version'),
+    ('status', 'Status'),
+    ('resolution', 'Resolution'),
+)
+
 
+def _read_urls(path: str) -> list:
+    """Ticket URLs listed in `path`, one per line; blank lines and # comments are skipped."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
 
-async def main():
-    # Example usage
-    ticket_url = input("Enter Trac ticket URL (or press Enter for default): ").strip()
-    if not ticket_url:
-        ticket_url = "https://trac.ffmpeg.org/ticket/10735"
-        print(f"Using default: {ticket_url}")
+
+async def main(urls=(), concurrency: int = 6, headless: bool = False, debug: bool = False,
+               compress: bool = False, to_stdout: bool = False, quiet: bool = False) -> int:
+    """Scrape `urls` (prompting for one if empty) and report; returns how many failed."""
+    # Everything but the tickets themselves goes to stderr, so stdout can be piped
+    urls = list(urls)
+    if not urls:
+        # Example usage
+        print("Enter Trac ticket URL (or press Enter for default): ",
+              end="", file=sys.stderr, flush=True)
+        ticket_url = input().strip()
+        if not ticket_url:
+            ticket_url = "https://trac.ffmpeg.org/ticket/10735"
+            print(f"Using default: {ticket_url}", file=sys.stderr)
+        urls = [ticket_url]
+    
+    if not quiet:
+        print("\n".join(["="*60, "Trac Ticket Scraper (Multi-Version Support)", "="*60, ""]),
+              file=sys.stderr)
     
-    print("="*60)
-    print("Trac Ticket Scraper (Multi-Version Support)")
-    print("="*60)
-    print()
+    # One browser, context and HTTP client for the whole batch
+    tickets = await scrape_many(urls, headless=headless, concurrency=concurrency,
+                                debug=debug, compress=compress)
+    failed = sum(isinstance(ticket_data, Exception) for ticket_data in tickets)
     
-    # Set headless=False to see the browser (useful for debugging)
-    # Set headless=True for production use
-    ticket_data = await scrape_trac_ticket(ticket_url, headless=False)
+    if to_stdout:
+        # One compact JSON document per scraped ticket (JSON Lines), in `urls` order
+        sys.stdout.buffer.write(b"".join(json_bytes(ticket_data, indent=False) + b"\n"
+                                         for ticket_data in tickets
+                                         if not isinstance(ticket_data, Exception)))
+        sys.stdout.flush()
+    if quiet:
+        return failed
     
-    print("\n" + "="*60)
-    print("Extraction Complete!")
-    print("="*60)
-    print("\nTicket Summary:")
-    print(f"  Number: {ticket_data['ticket_number']}")
-    if 'summary' in ticket_data['fields']:
-        print(f"  Summary: {ticket_data['fields']['summary']}")
-    print(f"\nKey Fields:")
-    for key in ['reported by', 'priority', 'component', 'version', 'status', 'resolution']:
-        if key in ticket_data['fields']:
-            print(f"  {key.title()}: {ticket_data['fields'][key]}")
+    # Collected and printed in one write
+    lines = ["\n" + "="*60, "Extraction Complete!" if not failed
+             else f"Extraction finished: {failed} of {len(tickets)} tickets failed", "="*60]
+    for url, ticket_data in zip(urls, tickets):
+        if isinstance(ticket_data, Exception):
+            lines += ["\nTicket Summary:", f"  URL: {url}", f"  ✗ Failed: {ticket_data!r}"]
+            continue
+        lines += ["\nTicket Summary:", f"  Number: {ticket_data['ticket_number']}"]
+        if 'summary' in ticket_data['fields']:
+            lines.append(f"  Summary: {ticket_data['fields']['summary']}")
+        lines.append("\nKey Fields:")
+        fields = ticket_data['fields']
+        lines += [f"  {label}: {fields[key]}" for key, label in _SUMMARY_FIELDS if key in fields]
+    print("\n".join(lines), file=sys.stderr)
+    return failed
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Scrape Trac tickets to JSON with attachments")
+    parser.add_argument("--url", action="append", dest="urls", default=[], metavar="URL",
+                        help="ticket URL to scrape (repeatable)")
+    parser.add_argument("--urls-file",
+                        help="file of ticket URLs, one per line (# starts a comment)")
+    parser.add_argument("--concurrency", type=int, default=6,
+                        help="maximum number of tickets loaded in the browser at once")
+    parser.add_argument("--headless", action="store_true",
+                        help="run the browser without a window (for batch / production runs)")
+    parser.add_argument("--debug", action="store_true",
+                        help="save screenshots and changelog HTML for browser-scraped tickets")
+    parser.add_argument("--compress", action="store_true",
+                        help="save tickets as zstd-compressed .json.zst (needs zstandard)")
+    parser.add_argument("--stdout", action="store_true", dest="to_stdout",
+                        help="also write each ticket to stdout as one line of JSON")
+    parser.add_argument("--quiet", action="store_true",
+                        help="only log warnings and skip the summary report")
+    args = parser.parse_args()
+    
+    urls = args.urls + (_read_urls(args.urls_file) if args.urls_file else [])
+    # Only prompt for a URL when someone is there to answer
+    if not urls and not sys.stdin.isatty():
+        parser.error("no ticket URLs given; use --url or --urls-file")
+    
+    listener = _start_logging(logging.WARNING if args.quiet else logging.INFO)
+    try:
+        # uvloop cuts per-await overhead on the many small Playwright round-trips
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop else None) as runner:
+            failed = runner.run(main(urls, args.concurrency, args.headless, args.debug,
+                                     args.compress, args.to_stdout, args.quiet))
+    finally:
+        listener.stop()
+    sys.exit(1 if failed else 0)